@@ -5,9 +5,66 @@ load_dotenv()
 
 # Model configuration
 MODEL_PATH = os.getenv('MODEL_PATH', 'plant-disease-model.pth')
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'eager').lower()
+MODEL_ARTIFACTS_DIR = os.getenv('MODEL_ARTIFACTS_DIR', 'artifacts')
 
 IN_CHANNELS = 3
 NUM_DISEASES = 38
+IMAGE_SIZE = 256
+
+# Use the draft-mode JPEG + OpenCV preprocessing path instead of PIL/torchvision
+FAST_DECODE = os.getenv('FAST_DECODE', 'False').lower() in ('true', '1', 't')
+
+# Upload limits
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 256 * 1024))
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', 20 * 1024 * 1024))
+MAX_REQUEST_BYTES = int(os.getenv('MAX_REQUEST_BYTES', 100 * 1024 * 1024))
+
+# Streaming batch analysis: files accepted per request and files read and
+# decoded concurrently while streaming
+MAX_STREAM_FILES = int(os.getenv('MAX_STREAM_FILES', 500))
+STREAM_WINDOW = int(os.getenv('STREAM_WINDOW', 8))
+
+# Cascade: score a downscaled copy first and rerun images whose confidence is
+# below CASCADE_THRESHOLD at full resolution. CASCADE_SHADOW_RATE is the share
+# of fast-tier answers also run at full resolution to measure agreement.
+CASCADE_ENABLED = os.getenv('CASCADE_ENABLED', 'False').lower() in ('true', '1', 't')
+CASCADE_IMAGE_SIZE = int(os.getenv('CASCADE_IMAGE_SIZE', 128))
+CASCADE_THRESHOLD = float(os.getenv('CASCADE_THRESHOLD', 0.9))
+CASCADE_SHADOW_RATE = float(os.getenv('CASCADE_SHADOW_RATE', 0.05))
+
+# Micro-batching configuration
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', 16))
+BATCH_MAX_WAIT_MS = float(os.getenv('BATCH_MAX_WAIT_MS', 5))
+
+# Executor configuration
+EXECUTOR_TYPE = os.getenv('EXECUTOR_TYPE', 'thread').lower()
+EXECUTOR_WORKERS = int(os.getenv('EXECUTOR_WORKERS', os.cpu_count() or 1))
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', 2))
+TORCH_NUM_THREADS = int(os.getenv('TORCH_NUM_THREADS', max(1, (os.cpu_count() or 1) // 2)))
+
+# Multi-process serving (see serve.py). INFERENCE_SERVERS lists the inference
+# processes to forward tensors to, as host:port or Unix socket paths separated
+# by commas; when empty the models run inside this process.
+INFERENCE_SERVERS = os.getenv('INFERENCE_SERVERS', '')
+INFERENCE_AUTHKEY = os.getenv('INFERENCE_AUTHKEY', '')
+HTTP_WORKERS = int(os.getenv('HTTP_WORKERS', 2))
+INFERENCE_PROCESSES = int(os.getenv('INFERENCE_PROCESSES', 2))
+INFERENCE_PROCESS_THREADS = int(os.getenv(
+    'INFERENCE_PROCESS_THREADS', max(1, (os.cpu_count() or 1) // max(1, INFERENCE_PROCESSES))
+))
+
+# Prediction cache configuration
+PREDICTION_CACHE_SIZE = int(os.getenv('PREDICTION_CACHE_SIZE', 1024))
+PREDICTION_CACHE_TTL = float(os.getenv('PREDICTION_CACHE_TTL', 3600))
+PREDICTION_CACHE_DIR = os.getenv('PREDICTION_CACHE_DIR', '')
+
+# NodeMCU pump configuration
+NODEMCU_URL = os.getenv('NODEMCU_URL', 'http://192.168.117.147/pump/action')
+PUMP_QUEUE_SIZE = int(os.getenv('PUMP_QUEUE_SIZE', 8))
+PUMP_TIMEOUT = float(os.getenv('PUMP_TIMEOUT', 5.0))
+PUMP_MAX_RETRIES = int(os.getenv('PUMP_MAX_RETRIES', 3))
+PUMP_RETRY_BACKOFF = float(os.getenv('PUMP_RETRY_BACKOFF', 0.5))
 
 # App configuration
 DEBUG = os.getenv('DEBUG', 'False').lower() in ('true', '1', 't')
@@ -0,0 +1,47 @@
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+LOG_FILE = 'nodemcu_connection.log'
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+
+def setup_logging(level: int = logging.INFO) -> None:
+    """Routes root logging through a queue so request handlers never touch the disk.
+
+    Records are put on an unbounded in-memory queue; a background listener
+    thread formats them and writes to the log file and the console. Safe to
+    call more than once.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.FileHandler(LOG_FILE), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    _queue_handler = QueueHandler(log_queue)
+    root.addHandler(_queue_handler)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging() -> None:
+    """Flushes queued records and stops the listener thread."""
+    global _listener, _queue_handler
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
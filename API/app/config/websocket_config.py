@@ -1,10 +1,23 @@
 from pydantic import BaseModel
+from typing import List
 import os
 from dotenv import load_dotenv
 
 class WebSocketConfig(BaseModel):
     FRAME_RATE: int = 30
     MAX_CONNECTIONS: int = 10
+    MAX_QUEUED_CONNECTIONS: int = 10
+    QUEUE_TIMEOUT: float = 30.0
+    MAX_STREAM_BATCH: int = 8
     FRAME_WIDTH: int = 512
     FRAME_HEIGHT: int = 344
+    STATS_INTERVAL: float = 1.0
+    BINARY_SUBPROTOCOL: str = 'heatmap.binary'
+    # Opt-in per-connection modes (see services/stream_state.py)
+    TARGET_LATENCY_MS: float = 100.0
+    RESOLUTION_SCALES: List[float] = [1.0, 0.75, 0.5, 0.375]
+    RENDER_SCALE: float = 0.5
+    ROI_THRESHOLD: float = 0.5
+    CHANGE_THRESHOLD: float = 3.0
+    CHANGE_THUMBNAIL_WIDTH: int = 64
     MODEL_PATH: str = os.getenv('CAM_MODEL_PATH', 'model_for_cam.pth')
\ No newline at end of file
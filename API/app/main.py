@@ -1,28 +1,27 @@
+import asyncio
+import json
 import logging
-import httpx
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse
+import time
+from fastapi import FastAPI, File, Request, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from services.prediction_service import PredictionService
 from schemas.prediction import PredictionResponse, PlantHealthSummary
-from typing import List
+from typing import AsyncIterator, List, Literal, Optional, Tuple
 from fastapi import UploadFile
-from config.config import DEBUG, HOST, PORT
+from config.config import DEBUG, HOST, PORT, MAX_STREAM_FILES
+from config.logging_config import setup_logging, stop_logging
 from fastapi.middleware.cors import CORSMiddleware
-from routers.websocket_router import router
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('nodemcu_connection.log'),
-        logging.StreamHandler()
-    ]
-)
+from routers.websocket_router import router, heatmap_service, scheduler, connection_manager
+from utils.executor import run_inference, shutdown_executors
+from utils.image_utils import UploadTooLargeError
+from utils.metrics import REGISTRY, REQUESTS
+
+setup_logging()
 logger = logging.getLogger(__name__)
 
 app = FastAPI(debug=DEBUG)
 prediction_service = PredictionService()
+readiness = {"ready": False, "warmup_seconds": None, "error": None}
 app.include_router(router)
 
 app.add_middleware(
@@ -33,17 +32,126 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def _register_metrics() -> None:
+    batcher, cache, pump = prediction_service.batcher, prediction_service.cache, prediction_service.pump
+    REGISTRY.gauge_callback('plant_queue_depth', 'Items waiting in internal queues.', lambda: [
+        ({"queue": "batcher"}, batcher.stats()["queue_depth"]),
+        ({"queue": "pump"}, pump.stats()["queue_depth"]),
+        ({"queue": "stream_scheduler"}, scheduler.stats()["pending_frames"]),
+        ({"queue": "websocket_admission"}, connection_manager.queued),
+    ])
+    REGISTRY.gauge_callback('plant_websocket_connections', 'Active heatmap streams.',
+                            lambda: connection_manager.active)
+    REGISTRY.counter_callback('plant_websocket_rejected_total', 'Heatmap streams turned away.',
+                              lambda: connection_manager.rejected)
+    REGISTRY.counter_callback('plant_prediction_cache_lookups_total', 'Prediction cache lookups.', lambda: [
+        ({"result": "hit"}, cache.hits),
+        ({"result": "miss"}, cache.misses),
+    ])
+    REGISTRY.gauge_callback('plant_prediction_cache_entries', 'Predictions held in memory.',
+                            lambda: cache.stats()["size"])
+    REGISTRY.counter_callback('plant_pump_commands_total', 'Pump commands by outcome.', lambda: [
+        ({"outcome": "sent"}, pump.sent),
+        ({"outcome": "failed"}, pump.failed),
+        ({"outcome": "coalesced"}, pump.coalesced),
+        ({"outcome": "dropped"}, pump.dropped),
+    ])
+    REGISTRY.counter_callback('plant_pump_retries_total', 'Pump command retries.', lambda: pump.retries)
+    REGISTRY.gauge_callback('plant_request_memory_peak_bytes', 'Peak RSS growth of batch requests.', lambda: [
+        ({"request": "last"}, prediction_service.request_memory["last_peak_bytes"]),
+        ({"request": "max"}, prediction_service.request_memory["max_peak_bytes"]),
+    ])
+
+    cascade = prediction_service.cascade
+    if cascade is not None:
+        REGISTRY.counter_callback('plant_cascade_predictions_total', 'Cascade predictions by decision.', lambda: [
+            ({"decision": "fast"}, cascade.fast),
+            ({"decision": "escalated"}, cascade.escalated),
+            ({"decision": "forced"}, cascade.forced),
+        ])
+        REGISTRY.gauge_callback('plant_cascade_escalation_ratio', 'Share of gated images sent to the full model.',
+                                lambda: cascade.stats()["escalation_rate"])
+        REGISTRY.counter_callback('plant_cascade_shadow_total', 'Fast answers rechecked at full size.', lambda: [
+            ({"result": "agree"}, cascade.shadow_agreed),
+            ({"result": "disagree"}, cascade.shadow_disagreed),
+        ])
+
+_register_metrics()
+
+@app.middleware("http")
+async def count_requests(request: Request, call_next):
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "unmatched"
+        REQUESTS.inc(method=request.method, endpoint=endpoint, status=status_code)
+
+async def _warmup() -> None:
+    """Loads both models and runs a dummy inference through each."""
+    started = time.perf_counter()
+    try:
+        await run_inference(prediction_service.warmup)
+        await run_inference(heatmap_service.warmup)
+    except Exception as e:
+        readiness["error"] = str(e)
+        logger.exception("Model warmup failed")
+        return
+    readiness["warmup_seconds"] = time.perf_counter() - started
+    readiness["ready"] = True
+    logger.info(f"Models warmed up in {readiness['warmup_seconds']:.2f}s")
+
+@app.on_event("startup")
+async def startup():
+    # Keep a reference so the task is not garbage collected while it runs.
+    app.state.warmup_task = asyncio.create_task(_warmup())
+
+@app.on_event("shutdown")
+async def shutdown():
+    warmup_task = getattr(app.state, "warmup_task", None)
+    if warmup_task is not None:
+        warmup_task.cancel()
+    await prediction_service.pump.close()
+    prediction_service.model.close()
+    if prediction_service.cascade is not None:
+        prediction_service.cascade.fast_model.close()
+    heatmap_service.model.close()
+    shutdown_executors()
+    stop_logging()
 
-@app.post("/predict", response_model=PredictionResponse)
-async def predict(file: UploadFile = File(...)):
+
+@app.post("/predict", response_model=PredictionResponse, response_model_exclude_none=True)
+async def predict(file: UploadFile = File(...), explain: Optional[Literal['array', 'png']] = None):
     try:
-        prediction = await prediction_service.predict(file)
-        return prediction
+        return await prediction_service.predict(file, explain)
+    except UploadTooLargeError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=413)
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=500)
+
+@app.get("/ready")
+async def ready():
+    return JSONResponse(content=readiness, status_code=200 if readiness["ready"] else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/inference/stats")
+async def inference_stats():
+    return {
+        "batcher": prediction_service.batcher.stats(),
+        "cache": prediction_service.cache.stats(),
+        "pump": prediction_service.pump.stats(),
+        "request_memory": prediction_service.request_memory,
+        "cascade": prediction_service.cascade.stats() if prediction_service.cascade else None,
+    }
     
-@app.post("/analize-plants", response_model=PlantHealthSummary)
-async def analyze_plants(files: List[UploadFile] = File(...)):
+@app.post("/analize-plants", response_model=PlantHealthSummary, response_model_exclude_none=True)
+async def analyze_plants(files: List[UploadFile] = File(...), explain: Optional[Literal['array', 'png']] = None):
     logger.info(f"Received analyze-plants request with {len(files)} files")
     try:
         if not files or len(files) > 10:
@@ -52,14 +160,49 @@ async def analyze_plants(files: List[UploadFile] = File(...)):
                 content={"error": "Envia de 1 a 10 imagenes"},
                 status_code=400
             )
-        summary = await prediction_service.analyze_batch(files)
+        summary = await prediction_service.analyze_batch(files, explain)
         logger.info("Analysis completed successfully")
         return summary
+    except UploadTooLargeError as e:
+        logger.warning(f"Rejected analyze-plants request: {str(e)}")
+        return JSONResponse(content={"error": str(e)}, status_code=413)
     except Exception as e:
         logger.error(f"Error in analyze_plants endpoint: {str(e)}")
         logger.exception("Detailed error information:")
         return JSONResponse(content={"error": str(e)}, status_code=500)
-    
+
+@app.post("/analize-plants/stream")
+async def analyze_plants_stream(request: Request, files: List[UploadFile] = File(...), format: Optional[str] = None,
+                                explain: Optional[Literal['array', 'png']] = None):
+    """Streams one result per image as it is scored, then the summary.
+
+    Responds with Server-Sent Events when ``format=sse`` or the client accepts
+    ``text/event-stream``, and with newline-delimited JSON otherwise. With
+    ``explain`` every prediction also carries its activation map.
+    """
+    logger.info(f"Received streaming analyze-plants request with {len(files)} files")
+    if not files or len(files) > MAX_STREAM_FILES:
+        logger.warning(f"Invalid number of files: {len(files)}")
+        return JSONResponse(
+            content={"error": f"Envia de 1 a {MAX_STREAM_FILES} imagenes"},
+            status_code=400
+        )
+
+    sse = format == "sse" or (format is None and "text/event-stream" in request.headers.get("accept", ""))
+    events = prediction_service.stream_batch(files, explain)
+    if sse:
+        return StreamingResponse(_format_sse(events), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache"})
+    return StreamingResponse(_format_ndjson(events), media_type="application/x-ndjson")
+
+async def _format_ndjson(events: AsyncIterator[Tuple[str, dict]]) -> AsyncIterator[str]:
+    async for event, payload in events:
+        yield json.dumps({"event": event, **payload}) + "\n"
+
+async def _format_sse(events: AsyncIterator[Tuple[str, dict]]) -> AsyncIterator[str]:
+    async for event, payload in events:
+        yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host=HOST, port=PORT)
\ No newline at end of file
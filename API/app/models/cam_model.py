@@ -3,11 +3,13 @@ import torch
 import torch.nn as nn
 import torchvision
 from typing import Tuple
+from models.weights import build_from_weights, load_weights
 
 class CAM(nn.Module):
     def __init__(self):
         super(CAM, self).__init__()
-        self.net = torchvision.models.resnet18(pretrained=True)
+        # The backbone weights come from the CAM checkpoint, not from ImageNet.
+        self.net = torchvision.models.resnet18(weights=None)
         self.net.fc = nn.Linear(in_features=512, out_features=4, bias=False)
     
     def forward(self, x) -> Tuple[torch.Tensor, torch.Tensor]:
@@ -23,4 +25,7 @@ class CAM(nn.Module):
         x = self.net.avgpool(x)
         x = torch.flatten(x, 1)
         x = self.net.fc(x)
-        return conv_features, x
\ No newline at end of file
+        return conv_features, x
+
+def load_cam_model(path: str) -> CAM:
+    return build_from_weights(CAM, load_weights(path))
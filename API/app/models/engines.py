@@ -0,0 +1,121 @@
+import os
+import threading
+from typing import Any, Callable, Tuple, Union
+import torch
+import torch.nn as nn
+from config.config import (
+    INFERENCE_BACKEND, INFERENCE_AUTHKEY, INFERENCE_SERVERS, MODEL_ARTIFACTS_DIR, TORCH_NUM_THREADS
+)
+
+BACKENDS = ('eager', 'torchscript', 'int8_dynamic', 'int8_static', 'onnx')
+
+EngineOutput = Union[torch.Tensor, Tuple[torch.Tensor, ...]]
+
+def logits_of(output: EngineOutput) -> torch.Tensor:
+    """Logits of an engine output; models that also return feature maps put them first."""
+    return output[-1] if isinstance(output, tuple) else output
+
+def artifact_path(model_name: str, backend: str, directory: str = MODEL_ARTIFACTS_DIR) -> str:
+    filename = f'{model_name}.onnx' if backend == 'onnx' else f'{model_name}.{backend}.pt'
+    return os.path.join(directory, filename)
+
+def select_quantized_engine() -> str:
+    supported = torch.backends.quantized.supported_engines
+    for engine in ('x86', 'fbgemm', 'qnnpack'):
+        if engine in supported:
+            torch.backends.quantized.engine = engine
+            return engine
+    raise RuntimeError("No quantized engine available in this torch build")
+
+class EagerEngine:
+    def __init__(self, model: nn.Module):
+        self.model = model.eval()
+
+    def __call__(self, x: torch.Tensor) -> EngineOutput:
+        with torch.no_grad():
+            return self.model(x)
+
+class TorchScriptEngine:
+    """Runs a frozen TorchScript graph (fp32 or int8)."""
+
+    def __init__(self, path: str):
+        self.model = torch.jit.load(path, map_location='cpu')
+        self.model.eval()
+
+    def __call__(self, x: torch.Tensor) -> EngineOutput:
+        with torch.no_grad():
+            return self.model(x)
+
+class OnnxEngine:
+    def __init__(self, path: str):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise RuntimeError("The 'onnx' inference backend requires the onnxruntime package") from e
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = TORCH_NUM_THREADS
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, x: torch.Tensor) -> EngineOutput:
+        outputs = self.session.run(None, {self.input_name: x.detach().cpu().numpy()})
+        tensors = tuple(torch.from_numpy(output) for output in outputs)
+        return tensors[0] if len(tensors) == 1 else tensors
+
+class LazyEngine:
+    """Defers building an engine until it is first called or ``load()`` is called.
+
+    Loading is guarded by a lock, so concurrent first calls build it once.
+    """
+
+    def __init__(self, loader: Callable[[], Any]):
+        self._loader = loader
+        self._engine = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    self._engine = self._loader()
+        return self._engine
+
+    def __call__(self, x: torch.Tensor) -> EngineOutput:
+        return self.load()(x)
+
+    def close(self) -> None:
+        """Releases what the engine holds open (remote connections); a no-op if it was never loaded."""
+        if self._engine is not None and hasattr(self._engine, 'close'):
+            self._engine.close()
+
+def load_engine(model_name: str, eager_factory: Callable[[], nn.Module],
+                backend: str = INFERENCE_BACKEND, servers: str = INFERENCE_SERVERS):
+    """Loads ``model_name`` for the configured backend.
+
+    Non-eager backends load the artifacts written by ``python -m tools.export_models``.
+    When ``servers`` is set nothing is loaded here; calls are forwarded to
+    those inference processes instead (see ``serve.py``).
+    """
+    if servers:
+        from models.remote import RemoteEngine
+        return RemoteEngine(model_name, servers.split(','), INFERENCE_AUTHKEY)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {BACKENDS}")
+    if backend == 'eager':
+        return EagerEngine(eager_factory())
+
+    path = artifact_path(model_name, backend)
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"No {backend} artifact for {model_name} at {path}; run `python -m tools.export_models`"
+        )
+    return open_artifact(path, backend)
+
+def open_artifact(path: str, backend: str):
+    if backend == 'onnx':
+        return OnnxEngine(path)
+    if backend.startswith('int8'):
+        select_quantized_engine()
+    return TorchScriptEngine(path)
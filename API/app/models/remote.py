@@ -0,0 +1,242 @@
+import itertools
+import logging
+import os
+import queue
+import threading
+from multiprocessing import connection, shared_memory
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+import numpy as np
+import torch
+from config.config import CASCADE_ENABLED, IN_CHANNELS, NUM_DISEASES
+from config.logging_config import setup_logging
+from config.websocket_config import WebSocketConfig
+from models.cam_model import load_cam_model
+from models.engines import load_engine
+from models.resnet9 import load_plant_disease_model
+
+logger = logging.getLogger(__name__)
+
+Address = Union[str, Tuple[str, int]]
+Layout = List[Tuple[int, Tuple[int, ...], str]]
+
+_ALIGNMENT = 64
+
+def parse_address(address: str) -> Address:
+    """``host:port`` selects TCP; anything else is a Unix socket path."""
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit() and '/' not in address:
+        return host, int(port)
+    return address
+
+class _OwnedBlock:
+    """Shared memory block owned by this side, replaced when a payload outgrows it."""
+
+    def __init__(self):
+        self.shm: Optional[shared_memory.SharedMemory] = None
+
+    def ensure(self, size: int) -> shared_memory.SharedMemory:
+        if self.shm is None or self.shm.size < size:
+            self.release()
+            self.shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+        return self.shm
+
+    def release(self) -> None:
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+class _PeerBlock:
+    """Mapping of the other side's block, re-attached when it is replaced."""
+
+    def __init__(self):
+        self.shm: Optional[shared_memory.SharedMemory] = None
+
+    def attach(self, name: str) -> shared_memory.SharedMemory:
+        if self.shm is None or self.shm.name != name:
+            self.release()
+            self.shm = shared_memory.SharedMemory(name=name)
+        return self.shm
+
+    def release(self) -> None:
+        if self.shm is not None:
+            self.shm.close()
+            self.shm = None
+
+def _layout(arrays: Sequence[np.ndarray]) -> Tuple[Layout, int]:
+    layout, offset = [], 0
+    for array in arrays:
+        layout.append((offset, array.shape, array.dtype.str))
+        offset += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+    return layout, offset
+
+def _write(shm: shared_memory.SharedMemory, tensors: Sequence[torch.Tensor]) -> Layout:
+    arrays = [tensor.detach().cpu().contiguous().numpy() for tensor in tensors]
+    layout, _ = _layout(arrays)
+    for array, (offset, shape, dtype) in zip(arrays, layout):
+        np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)[...] = array
+    return layout
+
+def _read(shm: shared_memory.SharedMemory, layout: Layout, copy: bool) -> Tuple[torch.Tensor, ...]:
+    tensors = []
+    for offset, shape, dtype in layout:
+        array = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+        tensors.append(torch.from_numpy(array.copy() if copy else array))
+    return tuple(tensors)
+
+def _payload_size(tensors: Sequence[torch.Tensor]) -> int:
+    return sum(-(-tensor.numel() * tensor.element_size() // _ALIGNMENT) * _ALIGNMENT for tensor in tensors)
+
+class _Channel:
+    """One connection to an inference process plus its two shared memory blocks.
+
+    The request block belongs to the client and the response block to the
+    server; both are reused across calls, so a call moves no tensor data
+    through the socket.
+    """
+
+    def __init__(self, address: Address, authkey: bytes):
+        self.conn = connection.Client(address, authkey=authkey)
+        self.request = _OwnedBlock()
+        self.response = _PeerBlock()
+
+    def run(self, model_name: str, x: torch.Tensor) -> Tuple[torch.Tensor, ...]:
+        shm = self.request.ensure(_payload_size([x]))
+        layout = _write(shm, [x])
+        self.conn.send((model_name, shm.name, layout))
+        status, payload = self.conn.recv()
+        if status != 'ok':
+            raise RuntimeError(f"Inference server failed on {model_name}: {payload}")
+        name, output_layout = payload
+        # The server reuses the block for the next call, so copy the outputs out.
+        return _read(self.response.attach(name), output_layout, copy=True)
+
+    def close(self) -> None:
+        self.conn.close()
+        self.response.release()
+        self.request.release()
+
+class RemoteEngine:
+    """Engine that forwards each batch to one of a pool of inference processes.
+
+    Connections are opened on demand, one per concurrent caller, and spread
+    round-robin over the servers; idle connections are reused.
+    """
+
+    def __init__(self, model_name: str, addresses: Sequence[str], authkey: str):
+        if not authkey:
+            raise ValueError("INFERENCE_AUTHKEY must be set to use INFERENCE_SERVERS")
+        self.model_name = model_name
+        self.addresses = [parse_address(address.strip()) for address in addresses if address.strip()]
+        self.authkey = authkey.encode()
+        self._next_address = itertools.cycle(self.addresses)
+        self._lock = threading.Lock()
+        self._idle: "queue.SimpleQueue[_Channel]" = queue.SimpleQueue()
+
+    def __call__(self, x: torch.Tensor):
+        channel = self._acquire()
+        try:
+            outputs = channel.run(self.model_name, x)
+        except (EOFError, OSError):
+            channel.close()
+            raise
+        finally:
+            if not channel.conn.closed:
+                self._idle.put(channel)
+        return outputs[0] if len(outputs) == 1 else outputs
+
+    def close(self) -> None:
+        """Closes the idle connections and unlinks the request blocks they created."""
+        while True:
+            try:
+                channel = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            channel.close()
+
+    def _acquire(self) -> _Channel:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            address = next(self._next_address)
+        return _Channel(address, self.authkey)
+
+class InferenceServer:
+    """Serves forward passes of the given engines to RemoteEngine clients.
+
+    Each client connection is handled on its own thread; the engines are
+    shared by all of them.
+    """
+
+    def __init__(self, address: Address, authkey: bytes, engines: Dict[str, Callable]):
+        self.address = address
+        self.authkey = authkey
+        self.engines = engines
+
+    def serve_forever(self, ready: Optional[Callable[[], None]] = None) -> None:
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+        with connection.Listener(self.address, authkey=self.authkey) as listener:
+            logger.info(f"Inference server listening on {self.address}")
+            if ready is not None:
+                ready()
+            while True:
+                try:
+                    conn = listener.accept()
+                except (connection.AuthenticationError, OSError) as e:
+                    logger.warning(f"Rejected inference client: {e!r}")
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn: connection.Connection) -> None:
+        request = _PeerBlock()
+        response = _OwnedBlock()
+        try:
+            while True:
+                try:
+                    model_name, name, layout = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    outputs = self._run(model_name, request.attach(name), layout)
+                    shm = response.ensure(_payload_size(outputs))
+                    conn.send(('ok', (shm.name, _write(shm, outputs))))
+                except Exception as e:
+                    logger.exception(f"Inference on {model_name} failed")
+                    conn.send(('error', f"{type(e).__name__}: {e}"))
+        finally:
+            conn.close()
+            request.release()
+            response.release()
+
+    def _run(self, model_name: str, shm: shared_memory.SharedMemory, layout: Layout) -> Tuple[torch.Tensor, ...]:
+        engine = self.engines.get(model_name)
+        if engine is None:
+            raise ValueError(f"Unknown model '{model_name}'")
+        inputs = _read(shm, layout, copy=False)
+        outputs = engine(*inputs)
+        return outputs if isinstance(outputs, tuple) else (outputs,)
+
+def run_server(address: str, authkey: bytes, threads: int, ready=None) -> None:
+    """Entry point of an inference process: loads the models, then serves them.
+
+    ``ready`` is an optional event set once the models are loaded and the
+    server is accepting connections.
+    """
+    setup_logging()
+    torch.set_num_threads(threads)
+    engines = {
+        'resnet9': load_engine(
+            'resnet9', lambda: load_plant_disease_model(IN_CHANNELS, NUM_DISEASES, return_features=True), servers=''
+        ),
+        'cam': load_engine('cam', lambda: load_cam_model(WebSocketConfig().MODEL_PATH), servers=''),
+    }
+    if CASCADE_ENABLED:
+        engines['resnet9_fast'] = load_engine(
+            'resnet9_fast', lambda: load_plant_disease_model(IN_CHANNELS, NUM_DISEASES, global_pool=True), servers=''
+        )
+    InferenceServer(parse_address(address), authkey, engines).serve_forever(
+        ready.set if ready is not None else None
+    )
@@ -1,12 +1,14 @@
-import torch
 import torch.nn as nn
 from models.base_model import ImageClassificationBase
 from models.utils import ConvBlock
+from models.weights import build_from_weights, load_weights
 from config.config import MODEL_PATH
 
 class ResNet9(ImageClassificationBase):
-    def __init__(self, in_channels, num_diseases):
+    def __init__(self, in_channels, num_diseases, return_features=False, global_pool=False):
         super().__init__()
+        # When set, forward returns (res2 feature maps, logits), like CAM does.
+        self.return_features = return_features
         
         self.conv1 = ConvBlock(in_channels, 64)
         self.conv2 = ConvBlock(64, 128, pool=True)
@@ -16,22 +18,32 @@ class ResNet9(ImageClassificationBase):
         self.conv4 = ConvBlock(256, 512, pool=True)
         self.res2 = nn.Sequential(ConvBlock(512, 512), ConvBlock(512, 512))
         
-        self.classifier = nn.Sequential(nn.MaxPool2d(4),
+        # res2 is 4x4 at 256px, where both pools take the same maximum; the
+        # global pool also accepts the smaller maps of downscaled inputs.
+        pool = nn.AdaptiveMaxPool2d(1) if global_pool else nn.MaxPool2d(4)
+        self.classifier = nn.Sequential(pool,
                                        nn.Flatten(),
                                        nn.Linear(512, num_diseases))
-        
-    def forward(self, xb):
+
+    def features(self, xb):
         out = self.conv1(xb)
         out = self.conv2(out)
         out = self.res1(out) + out
         out = self.conv3(out)
         out = self.conv4(out)
         out = self.res2(out) + out
-        out = self.classifier(out)
         return out
 
-def load_plant_disease_model(in_channels, num_diseases):
-    model = ResNet9(in_channels, num_diseases)
-    model.load_state_dict(torch.load(MODEL_PATH, map_location=torch.device('cpu')))
-    model.eval()
-    return model
\ No newline at end of file
+    def classify(self, features):
+        return self.classifier(features)
+        
+    def forward(self, xb):
+        features = self.features(xb)
+        out = self.classify(features)
+        if self.return_features:
+            return features, out
+        return out
+
+def load_plant_disease_model(in_channels, num_diseases, return_features=False, global_pool=False, state_dict=None):
+    return build_from_weights(lambda: ResNet9(in_channels, num_diseases, return_features, global_pool),
+                              load_weights(MODEL_PATH) if state_dict is None else state_dict)
@@ -0,0 +1,40 @@
+import logging
+import zipfile
+from typing import Callable, Dict
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+def load_weights(path: str) -> Dict[str, torch.Tensor]:
+    """Loads a state dict on the CPU without reading it into private memory.
+
+    Zip-format ``.pth`` checkpoints (the ``torch.save`` default) are
+    memory-mapped, so every worker loading the same file shares its pages
+    through the page cache. ``.safetensors`` files are loaded with the
+    safetensors package. Only tensors are unpickled in either case.
+    """
+    if path.endswith('.safetensors'):
+        try:
+            from safetensors.torch import load_file
+        except ImportError as e:
+            raise RuntimeError("Loading .safetensors weights requires the safetensors package") from e
+        return load_file(path, device='cpu')
+
+    if not zipfile.is_zipfile(path):
+        logger.warning(f"{path} uses the legacy torch.save format and cannot be memory-mapped")
+        return torch.load(path, map_location='cpu', weights_only=True)
+    return torch.load(path, map_location='cpu', mmap=True, weights_only=True)
+
+def build_from_weights(factory: Callable[[], nn.Module], state_dict: Dict[str, torch.Tensor]) -> nn.Module:
+    """Builds ``factory()`` on the meta device and adopts the given tensors.
+
+    Skipping parameter initialisation and assigning the loaded tensors
+    directly (instead of copying into freshly allocated ones) keeps
+    memory-mapped weights shared.
+    """
+    with torch.device('meta'):
+        model = factory()
+    model.load_state_dict(state_dict, assign=True)
+    model.eval()
+    return model
@@ -1,25 +1,84 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+import asyncio
+from typing import Optional, Tuple
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+from config.config import INFERENCE_WORKERS
 from services.heatmap_service import HeatmapService
-from utils.frame_processing import FrameProcessor
+from services.connection_manager import ConnectionManager
+from services.stream_scheduler import FairFrameScheduler
+from services.stream_session import HeatmapStreamSession
+from services.stream_state import StreamOptions
 
 router = APIRouter()
 heatmap_service = HeatmapService()
-frame_processor = FrameProcessor()
+scheduler = FairFrameScheduler(
+    heatmap_service,
+    concurrency=INFERENCE_WORKERS,
+    max_batch_size=heatmap_service.config.MAX_STREAM_BATCH
+)
+connection_manager = ConnectionManager(
+    heatmap_service.config.MAX_CONNECTIONS,
+    heatmap_service.config.MAX_QUEUED_CONNECTIONS,
+    heatmap_service.config.QUEUE_TIMEOUT
+)
+
+def _negotiate_binary(websocket: WebSocket) -> Tuple[bool, Optional[str]]:
+    """Binary mode is selected by the subprotocol or by ``?mode=binary``."""
+    subprotocol = heatmap_service.config.BINARY_SUBPROTOCOL
+    if subprotocol in websocket.scope.get("subprotocols", []):
+        return True, subprotocol
+    return websocket.query_params.get("mode") == "binary", None
+
+async def _wait_for_disconnect(websocket: WebSocket) -> None:
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+async def _wait_for_slot(websocket: WebSocket) -> Optional[bool]:
+    """Waits in the connection queue; ``None`` if the client disconnects first.
+
+    Frames sent while queued are discarded.
+    """
+    acquire = asyncio.create_task(connection_manager.acquire())
+    disconnect = asyncio.create_task(_wait_for_disconnect(websocket))
+    done, _ = await asyncio.wait({acquire, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    if acquire in done:
+        disconnect.cancel()
+        await asyncio.gather(disconnect, return_exceptions=True)
+        return acquire.result()
+
+    acquire.cancel()
+    acquired = (await asyncio.gather(acquire, return_exceptions=True))[0]
+    if acquired is True:
+        connection_manager.release()
+    return None
+
+@router.get("/ws/stats")
+async def websocket_stats():
+    return {"connections": connection_manager.stats(), "scheduler": scheduler.stats()}
 
 @router.websocket("/ws/heatmap")
 async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
+    binary, subprotocol = _negotiate_binary(websocket)
+    await websocket.accept(subprotocol=subprotocol)
+
+    try:
+        options = StreamOptions.from_query(websocket.query_params, heatmap_service.config)
+    except ValueError as e:
+        await websocket.send_json({"error": f"Invalid stream options: {e}"})
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    if not connection_manager.try_acquire():
+        await websocket.send_json({"status": "queued", "position": connection_manager.queued + 1})
+        admitted = await _wait_for_slot(websocket)
+        if admitted is None:
+            return
+        if not admitted:
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="Server busy")
+            return
+
     try:
-        while True:
-            frame_data = await websocket.receive_text()
-            try:
-                frame_bytes = frame_processor.decode_frame(frame_data)
-                processed_frame = await heatmap_service.process_frame(frame_bytes)
-                response_data = frame_processor.encode_frame(processed_frame)
-                await websocket.send_text(response_data)
-                
-            except ValueError as e:
-                await websocket.send_json({"error": str(e)})
-                
+        await HeatmapStreamSession(websocket, scheduler, heatmap_service.config, binary, options).run()
     except WebSocketDisconnect:
-        print("Client disconnected")
\ No newline at end of file
+        print("Client disconnected")
+    finally:
+        connection_manager.release()
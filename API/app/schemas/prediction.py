@@ -1,18 +1,33 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Literal, Optional, Union
 
 class PredictionResult(BaseModel):
     class_name: str
     plant: str
     condition: str
     confidence: float
+    # Cascade tier that answered: 'fast' (downscaled input) or 'full'; only set when the cascade is enabled.
+    tier: Optional[Literal['fast', 'full']] = None
+
+class Explanation(BaseModel):
+    """Class activation map of the predicted class, as uint8 values (255 = most activated).
+
+    ``data`` is the map as nested lists for ``array`` and a base64-encoded
+    grayscale PNG for ``png``.
+    """
+    format: Literal['array', 'png']
+    height: int
+    width: int
+    data: Union[List[List[int]], str]
 
 class PredictionResponseMulti(BaseModel):
     filename: str
     prediction: PredictionResult
+    explanation: Optional[Explanation] = None
 
 class PredictionResponse(BaseModel):
     prediction: PredictionResult
+    explanation: Optional[Explanation] = None
 
 class PlantHealthSummary(BaseModel):
     total_plants: int
@@ -22,6 +37,10 @@ class PlantHealthSummary(BaseModel):
     diseased_percentage: float
     condition: str
     plant: str
+    # Per-image results with their activation maps; only set when explain is requested.
+    predictions: Optional[List[PredictionResponseMulti]] = None
+    # Files skipped for exceeding the per-file upload limit.
+    rejected_files: Optional[List[str]] = None
 
 def parse_class_name(class_name: str) -> tuple[str, str]:
     parts = class_name.split('___')
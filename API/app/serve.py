@@ -0,0 +1,72 @@
+"""Runs the API as several front-end workers backed by a pool of inference processes.
+
+    python serve.py --workers 4 --inference-processes 2 --threads 4
+
+Each inference process loads the ResNet9 and CAM weights once (memory-mapped,
+so the processes share the pages) and serves forward passes over a Unix
+socket. The uvicorn workers handle HTTP and websocket traffic, decode and
+preprocess images, and hand the tensors to the inference processes through
+shared memory. Keep ``inference-processes * threads`` at or below the number
+of physical cores.
+"""
+import argparse
+import multiprocessing
+import os
+import secrets
+import shutil
+import tempfile
+import uvicorn
+from config.config import HOST, PORT, HTTP_WORKERS, INFERENCE_PROCESSES, INFERENCE_PROCESS_THREADS
+from models.remote import run_server
+
+def start_inference_processes(count: int, threads: int, socket_dir: str, authkey: str, timeout: float):
+    context = multiprocessing.get_context('spawn')
+    processes, addresses = [], []
+    for i in range(count):
+        address = os.path.join(socket_dir, f'inference-{i}.sock')
+        ready = context.Event()
+        process = context.Process(
+            target=run_server,
+            args=(address, authkey.encode(), threads, ready),
+            name=f'inference-{i}',
+            daemon=True
+        )
+        process.start()
+        processes.append((process, ready))
+        addresses.append(address)
+
+    for process, ready in processes:
+        if not ready.wait(timeout):
+            raise SystemExit(f"{process.name} did not start within {timeout}s")
+    return [process for process, _ in processes], addresses
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=HTTP_WORKERS, help="Front-end uvicorn workers")
+    parser.add_argument('--inference-processes', type=int, default=INFERENCE_PROCESSES)
+    parser.add_argument('--threads', type=int, default=INFERENCE_PROCESS_THREADS,
+                        help="Intra-op threads per inference process")
+    parser.add_argument('--startup-timeout', type=float, default=120.0)
+    args = parser.parse_args()
+
+    authkey = secrets.token_hex(16)
+    socket_dir = tempfile.mkdtemp(prefix='plant-inference-')
+    processes = []
+    try:
+        processes, addresses = start_inference_processes(
+            args.inference_processes, args.threads, socket_dir, authkey, args.startup_timeout
+        )
+        # The uvicorn workers read these through config.config when they import main.
+        os.environ['INFERENCE_SERVERS'] = ','.join(addresses)
+        os.environ['INFERENCE_AUTHKEY'] = authkey
+        uvicorn.run('main:app', host=args.host, port=args.port, workers=args.workers)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join(timeout=5)
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import asyncio
+from collections import Counter
+from typing import Any, Callable, List, Optional, Set, Tuple
+from utils.executor import run_inference
+
+class InferenceBatcher:
+    """Gathers concurrent single-image requests into one batched forward pass.
+
+    Requests wait at most ``max_wait_ms`` for companions; a batch is dispatched
+    as soon as it reaches ``max_batch_size`` or the window closes. Up to
+    ``max_in_flight`` batches run at once (one per inference worker); while
+    all of them are busy, new requests keep queueing and go out together in
+    the next batch.
+    """
+
+    def __init__(self, infer_fn: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int, max_wait_ms: float, max_in_flight: int = 1):
+        self.infer_fn = infer_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.max_in_flight = max(1, max_in_flight)
+        self.batch_sizes = Counter()
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._in_flight: Set[asyncio.Task] = set()
+
+    async def submit(self, item: Any) -> Any:
+        """Queues one item for ``infer_fn`` (an image tensor, or whatever it batches) and awaits its result."""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    def stats(self) -> dict:
+        batches = sum(self.batch_sizes.values())
+        items = sum(size * count for size, count in self.batch_sizes.items())
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "in_flight": len(self._in_flight),
+            "max_in_flight": self.max_in_flight,
+            "batches": batches,
+            "items": items,
+            "mean_batch_size": items / batches if batches else 0.0,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+        }
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+            self._worker = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            # Collect the next batch only once a worker can take it.
+            await self._slots.acquire()
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            task = asyncio.create_task(self._run_batch(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._batch_done)
+
+    def _batch_done(self, task: asyncio.Task) -> None:
+        self._in_flight.discard(task)
+        self._slots.release()
+
+    async def _run_batch(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        batch = [(item, future) for item, future in batch if not future.done()]
+        if not batch:
+            return
+
+        self.batch_sizes[len(batch)] += 1
+        items = [item for item, _ in batch]
+        try:
+            results = await run_inference(self.infer_fn, items)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
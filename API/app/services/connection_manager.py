@@ -0,0 +1,75 @@
+import asyncio
+from collections import deque
+from typing import Deque
+
+class ConnectionManager:
+    """Admission control for streaming connections.
+
+    Up to ``max_connections`` streams are active at once; further clients wait
+    in a FIFO queue of at most ``max_queued`` entries for ``queue_timeout``
+    seconds and are rejected beyond that. Cancelling ``acquire`` (for example
+    when the client disconnects) gives up the place in the queue.
+    """
+
+    def __init__(self, max_connections: int, max_queued: int, queue_timeout: float):
+        self.max_connections = max_connections
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.rejected = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter.done())
+
+    def try_acquire(self) -> bool:
+        if self.active < self.max_connections and not self.queued:
+            self.active += 1
+            return True
+        return False
+
+    async def acquire(self) -> bool:
+        if self.try_acquire():
+            return True
+        if self.queued >= self.max_queued:
+            self.rejected += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            self._pass_on(waiter)
+            self.rejected += 1
+            return False
+        except asyncio.CancelledError:
+            self._pass_on(waiter)
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _pass_on(self, waiter: asyncio.Future) -> None:
+        # release() may have handed this waiter the slot just as it gave up.
+        if waiter.done() and not waiter.cancelled():
+            self.release()
+
+    def release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # Hand the slot straight to the next client in line.
+                waiter.set_result(True)
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "max_connections": self.max_connections,
+        }
@@ -0,0 +1,285 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, List, Optional
+import cv2
+import numpy as np
+from services.heatmap_service import HeatmapService
+from services.stream_state import StreamState
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+class LatestQueue:
+    """Bounded hand-off between two pipeline threads.
+
+    When full, ``put`` discards the oldest item so a slow consumer always gets
+    the newest frame (latest wins). With ``drop=False`` it blocks instead, so
+    every frame is processed; that is what benchmarks over files want.
+    ``close`` wakes everyone up; ``get`` then returns ``None`` once the queue
+    is drained.
+    """
+
+    def __init__(self, maxsize: int = 1, drop: bool = True):
+        self.maxsize = max(1, maxsize)
+        self.drop = drop
+        self.dropped = 0
+        self._items: Deque[Any] = deque()
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def put(self, item: Any) -> None:
+        with self._condition:
+            while not self.drop and len(self._items) >= self.maxsize and not self._closed:
+                self._condition.wait()
+            if self._closed:
+                return
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._condition.notify_all()
+
+    def get(self) -> Optional[Any]:
+        with self._condition:
+            while not self._items and not self._closed:
+                self._condition.wait()
+            if not self._items:
+                return None
+            item = self._items.popleft()
+            self._condition.notify_all()
+            return item
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+class CaptureSource:
+    """Camera or video file read through ``cv2.VideoCapture``."""
+
+    def __init__(self, source, live: bool):
+        self.capture = cv2.VideoCapture(source)
+        if not self.capture.isOpened():
+            raise ValueError(f"Cannot open video source {source!r}")
+        self.live = live
+
+    def read(self) -> Optional[np.ndarray]:
+        ok, frame = self.capture.read()
+        return frame if ok else None
+
+    def release(self) -> None:
+        self.capture.release()
+
+class ImageDirectorySource:
+    """Images of a directory in name order, as if they were video frames."""
+
+    live = False
+
+    def __init__(self, directory: str, loop: bool = False):
+        self.paths = sorted(
+            os.path.join(directory, name) for name in os.listdir(directory)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        if not self.paths:
+            raise ValueError(f"No images in {directory}")
+        self.loop = loop
+        self._index = 0
+
+    def read(self) -> Optional[np.ndarray]:
+        while self._index < len(self.paths) or (self.loop and self.paths):
+            path = self.paths[self._index % len(self.paths)]
+            self._index += 1
+            frame = cv2.imread(path, cv2.IMREAD_COLOR)
+            if frame is not None:
+                return frame
+            logger.warning(f"Skipping unreadable image {path}")
+        return None
+
+    def release(self) -> None:
+        pass
+
+def open_source(spec: str, loop: bool = False):
+    """A camera index (``0``), an image directory or a video file."""
+    if spec.isdigit():
+        return CaptureSource(int(spec), live=True)
+    if os.path.isdir(spec):
+        return ImageDirectorySource(spec, loop)
+    if not os.path.exists(spec):
+        raise ValueError(f"No camera, directory or video file at {spec!r}")
+    return CaptureSource(spec, live=False)
+
+class WindowSink:
+    """Shows frames in an OpenCV window; pressing ``q`` stops the pipeline."""
+
+    def __init__(self, title: str = "Real-Time Heatmap"):
+        self.title = title
+
+    def write(self, frame: np.ndarray) -> bool:
+        cv2.imshow(self.title, frame)
+        return cv2.waitKey(1) & 0xFF != ord('q')
+
+    def close(self) -> None:
+        cv2.destroyAllWindows()
+
+class VideoFileSink:
+    """Writes frames to a video file, sized from the first frame."""
+
+    def __init__(self, path: str, fps: float = 30.0):
+        self.path = path
+        self.fps = fps
+        self.writer: Optional[cv2.VideoWriter] = None
+
+    def write(self, frame: np.ndarray) -> bool:
+        if self.writer is None:
+            h, w = frame.shape[:2]
+            self.writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*'mp4v'), self.fps, (w, h))
+        self.writer.write(frame)
+        return True
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.release()
+
+class NullSink:
+    """Discards frames, for headless runs and benchmarks."""
+
+    def write(self, frame: np.ndarray) -> bool:
+        return True
+
+    def close(self) -> None:
+        pass
+
+class HeatmapPipeline:
+    """Capture, inference and display stages on their own threads.
+
+    The capture thread reads the source into a bounded queue, the inference
+    thread runs ``HeatmapService.render_frames`` on whatever frame is newest,
+    and the calling thread hands results to the sink (OpenCV windows must be
+    driven from the main thread on some platforms). With the default
+    latest-wins queues a camera keeps capturing while a frame is in the
+    model, and stale frames are dropped instead of building up latency.
+
+    ``fps`` paces non-live sources; files are otherwise read as fast as the
+    pipeline takes them.
+    """
+
+    def __init__(self, source, service: HeatmapService, sink, label: int = 2,
+                 state: Optional[StreamState] = None, drop_frames: bool = True,
+                 queue_size: int = 1, fps: Optional[float] = None):
+        self.source = source
+        self.service = service
+        self.sink = sink
+        self.label = label
+        self.state = state
+        self.fps = fps
+        self.frames = LatestQueue(queue_size, drop_frames)
+        self.results = LatestQueue(queue_size, drop_frames)
+        self._stop = threading.Event()
+        self.captured = 0
+        self.processed = 0
+        self.displayed = 0
+        self.errors = 0
+        self._latencies: List[float] = []
+        self._inference_seconds = 0.0
+
+    def run(self, max_frames: Optional[int] = None) -> dict:
+        """Runs until the source ends, the sink stops it or ``max_frames`` are shown."""
+        threads = [
+            threading.Thread(target=self._capture, name='capture', daemon=True),
+            threading.Thread(target=self._infer, name='inference', daemon=True),
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            while not self._stop.is_set():
+                item = self.results.get()
+                if item is None:
+                    break
+                captured_at, frame = item
+                if not self.sink.write(frame):
+                    break
+                self.displayed += 1
+                self._latencies.append(time.perf_counter() - captured_at)
+                if max_frames is not None and self.displayed >= max_frames:
+                    break
+        finally:
+            self.stop()
+            for thread in threads:
+                thread.join()
+            self.source.release()
+            self.sink.close()
+        return self.stats(time.perf_counter() - start)
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.frames.close()
+        self.results.close()
+
+    def _capture(self) -> None:
+        interval = 1 / self.fps if self.fps and not self.source.live else 0.0
+        next_frame = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                frame = self.source.read()
+                if frame is None:
+                    break
+                self.captured += 1
+                self.frames.put((time.perf_counter(), frame))
+                if interval:
+                    next_frame += interval
+                    time.sleep(max(0.0, next_frame - time.perf_counter()))
+        except Exception:
+            logger.exception("Frame capture failed")
+        finally:
+            self.frames.close()
+
+    def _infer(self) -> None:
+        try:
+            while not self._stop.is_set():
+                item = self.frames.get()
+                if item is None:
+                    break
+                captured_at, frame = item
+                started = time.perf_counter()
+                try:
+                    heatmap = self.service.render_frames([frame], self.label, [self.state])[0]
+                except Exception:
+                    self.errors += 1
+                    logger.exception("Heatmap inference failed")
+                    continue
+                seconds = time.perf_counter() - started
+                if self.state is not None:
+                    self.state.record_latency(seconds)
+                self._inference_seconds += seconds
+                self.processed += 1
+                self.results.put((captured_at, heatmap))
+        finally:
+            self.results.close()
+
+    def stats(self, elapsed: float) -> dict:
+        latencies = sorted(self._latencies)
+
+        def percentile(q: float) -> Optional[float]:
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else None
+
+        stats = {
+            "captured": self.captured,
+            "dropped_before_inference": self.frames.dropped,
+            "processed": self.processed,
+            "dropped_before_display": self.results.dropped,
+            "displayed": self.displayed,
+            "errors": self.errors,
+            "elapsed_s": elapsed,
+            "fps": self.displayed / elapsed if elapsed else 0.0,
+            "inference_ms_mean": self._inference_seconds / self.processed * 1000 if self.processed else None,
+            "latency_ms_p50": percentile(0.5),
+            "latency_ms_p95": percentile(0.95),
+        }
+        if self.state is not None:
+            stats.update(self.state.stats())
+        return stats
@@ -0,0 +1,43 @@
+from collections import Counter
+from schemas.prediction import PredictionResult, PlantHealthSummary
+
+class HealthSummaryAccumulator:
+    """Running totals behind ``PlantHealthSummary``, updated one prediction at a time."""
+
+    def __init__(self):
+        self.healthy_count = 0
+        self.diseased_count = 0
+        self.plants = Counter()
+        self.conditions = Counter()
+
+    @property
+    def total(self) -> int:
+        return self.healthy_count + self.diseased_count
+
+    @property
+    def diseased_percentage(self) -> float:
+        return (self.diseased_count / self.total) * 100 if self.total else 0.0
+
+    def add(self, prediction: PredictionResult) -> None:
+        self.plants[prediction.plant] += 1
+        if prediction.condition != "healthy":
+            self.conditions[prediction.condition] += 1
+
+        if prediction.condition.lower() == "healthy":
+            self.healthy_count += 1
+        else:
+            self.diseased_count += 1
+
+    def summary(self) -> PlantHealthSummary:
+        if self.total == 0:
+            raise ValueError("No valid predictions were made")
+
+        return PlantHealthSummary(
+            total_plants=self.total,
+            healthy_count=self.healthy_count,
+            diseased_count=self.diseased_count,
+            healthy_percentage=(self.healthy_count / self.total) * 100,
+            diseased_percentage=self.diseased_percentage,
+            condition=str(self.conditions.most_common(1)[0][0]) if self.conditions else "healthy",
+            plant=str(self.plants.most_common(1)[0][0])
+        )
@@ -1,23 +1,35 @@
+from typing import Dict, List, Optional, Tuple, Union
 import torch
 import numpy as np
 import cv2
 from PIL import Image
 from torchvision import transforms
 from models.cam_model import CAM
+from models.engines import LazyEngine, load_engine
+from models.weights import build_from_weights, load_weights
+from config.config import INFERENCE_BACKEND, INFERENCE_SERVERS
 from config.websocket_config import WebSocketConfig
+from utils.executor import run_inference
+from services.stream_state import StreamState
+from utils.metrics import BATCH_SIZE, CAM_REUSED, stage_timer
 
 class HeatmapService:
     def __init__(self):
         self.config = WebSocketConfig()
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.model = self._initialize_model()
+        use_cuda = torch.cuda.is_available() and INFERENCE_BACKEND == 'eager' and not INFERENCE_SERVERS
+        self.device = torch.device('cuda' if use_cuda else 'cpu')
+        self.fc_weight: Optional[torch.Tensor] = None
+        self.model = LazyEngine(self._load_model)
+        self.default_size = (self.config.FRAME_HEIGHT, self.config.FRAME_WIDTH)
         self.transform = self._initialize_transform()
 
-    def _initialize_model(self) -> CAM:
-        model = CAM().to(self.device)
-        model.load_state_dict(torch.load(self.config.MODEL_PATH))
-        model.eval()
-        return model
+    def _load_model(self):
+        state_dict = load_weights(self.config.MODEL_PATH)
+        self.fc_weight = state_dict['net.fc.weight'].to(self.device)
+        return load_engine('cam', lambda: self._initialize_model(state_dict))
+
+    def _initialize_model(self, state_dict: dict) -> CAM:
+        return build_from_weights(CAM, state_dict).to(self.device)
 
     def _initialize_transform(self):
         return transforms.Compose([
@@ -25,30 +37,154 @@ class HeatmapService:
             transforms.ToTensor(),
         ])
 
+    def warmup(self) -> None:
+        """Loads the model and runs one frame through it."""
+        self.render_frames([np.zeros((self.config.FRAME_HEIGHT, self.config.FRAME_WIDTH, 3), np.uint8)])
+
     async def process_frame(self, frame_bytes: bytes, label: int = 2) -> bytes:
+        result = (await self.process_frames([frame_bytes], label))[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def process_frames(self, frames: List[bytes], label: int = 2,
+                             states: Optional[List[Optional[StreamState]]] = None) -> List[Union[bytes, Exception]]:
+        """Processes frames from several streams with batched forward passes.
+
+        ``states`` optionally gives each frame's per-connection ``StreamState``;
+        frames without one take the fixed full-resolution path. Frames are
+        batched by model input size. Frames that cannot be decoded get their
+        exception in place of a result.
+        """
+        return await run_inference(self._process_frames_sync, frames, label, states)
+
+    def _process_frames_sync(self, frames: List[bytes], label: int,
+                             states: Optional[List[Optional[StreamState]]] = None) -> List[Union[bytes, Exception]]:
+        states = states or [None] * len(frames)
+        results: List[Union[bytes, Exception]] = []
+        decoded = []
+        with stage_timer('heatmap', 'decode'):
+            for i, frame_bytes in enumerate(frames):
+                try:
+                    decoded.append((i, self._decode_frame(frame_bytes), states[i]))
+                    results.append(None)
+                except ValueError as e:
+                    results.append(e)
+
+        if not decoded:
+            return results
+
+        cams = self._frame_cams(decoded, label)
+        with stage_timer('heatmap', 'postprocess'):
+            for i, frame, state in decoded:
+                results[i] = self._render_for(frame, cams[i], state)
+        return results
+
+    def render_frames(self, frames: List[np.ndarray], label: int = 2,
+                      states: Optional[List[Optional[StreamState]]] = None) -> List[np.ndarray]:
+        """Blends heatmaps into already decoded BGR frames, in the calling thread.
+
+        The synchronous counterpart of ``process_frames`` for local viewers
+        (see ``services/frame_pipeline.py``), which have frames in memory and
+        display the result instead of sending JPEG bytes.
+        """
+        states = states or [None] * len(frames)
+        decoded = [(i, frame, state) for i, (frame, state) in enumerate(zip(frames, states))]
+        cams = self._frame_cams(decoded, label)
+        with stage_timer('heatmap', 'postprocess'):
+            return [self._compose_for(frame, cams[i], state) for i, frame, state in decoded]
+
+    def _frame_cams(self, decoded: List[Tuple[int, np.ndarray, Optional[StreamState]]],
+                    label: int) -> Dict[int, np.ndarray]:
+        cams: Dict[int, np.ndarray] = {}
+        groups: Dict[Tuple[int, int], list] = {}
+        for i, frame, state in decoded:
+            thumbnail = state.make_thumbnail(frame) if state is not None else None
+            reused = state.reusable_cam(thumbnail) if state is not None else None
+            if reused is not None:
+                cams[i] = reused
+                CAM_REUSED.inc()
+                continue
+            size = state.input_size if state is not None else self.default_size
+            groups.setdefault(size, []).append((i, frame, state, thumbnail))
+
+        for size, group in groups.items():
+            BATCH_SIZE.observe(len(group), pipeline='heatmap')
+            with stage_timer('heatmap', 'preprocess'):
+                input_tensor = torch.stack([self._to_tensor(frame, size) for _, frame, _, _ in group]).to(self.device)
+            with stage_timer('heatmap', 'inference'):
+                conv, _ = self.model(input_tensor)
+                maps = self.cam_maps(conv, label)
+            for (i, _, state, thumbnail), cam in zip(group, maps):
+                cams[i] = state.update(cam, thumbnail) if state is not None else cam
+        return cams
+
+    def cams_from_features(self, conv: torch.Tensor, label: int) -> np.ndarray:
+        return self._to_uint8(self.cam_maps(conv, label))
+
+    def cam_maps(self, conv: torch.Tensor, label: int) -> np.ndarray:
+        """Class activation maps scaled to [0, 1] per image, as float32."""
+        with torch.no_grad():
+            weights = self.fc_weight[label].abs()[None, :, None, None]
+            cams = (weights * conv.abs()).sum(1)
+        return self._normalize_cams(cams.cpu().numpy())
+
+    def _decode_frame(self, frame_bytes: bytes) -> np.ndarray:
         nparr = np.frombuffer(frame_bytes, np.uint8)
         frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError("Error decoding frame: not a valid image")
+        return frame
 
+    def _to_tensor(self, frame: np.ndarray, size: Optional[Tuple[int, int]] = None) -> torch.Tensor:
         frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        pil_image = Image.fromarray(frame_rgb)
-        
-        input_tensor = self.transform(pil_image).unsqueeze(0).to(self.device)
-        
-        with torch.no_grad():
-            conv, _ = self.model(input_tensor)
-            cam = (self.model.net.fc.weight[label][:, None, None].abs() * conv[0].abs()).sum(0)
-            cam = cam.cpu().numpy()
-            cam = self._normalize_cam(cam)
-            
+        image = Image.fromarray(frame_rgb)
+        if size is None or size == self.default_size:
+            return self.transform(image)
+        return transforms.functional.to_tensor(transforms.functional.resize(image, list(size)))
+
+    def _render_for(self, frame: np.ndarray, cam: np.ndarray, state: Optional[StreamState]) -> bytes:
+        return self._encode(self._compose_for(frame, cam, state))
+
+    def _compose_for(self, frame: np.ndarray, cam: np.ndarray, state: Optional[StreamState]) -> np.ndarray:
+        render = state.options.render if state is not None else 'full'
+        if render == 'reduced':
             h, w = frame.shape[:2]
-            cam_resized = cv2.resize(cam, (w, h))
-            heatmap = cv2.applyColorMap(cam_resized, cv2.COLORMAP_JET)
-            blended_frame = cv2.addWeighted(frame, 0.6, heatmap, 0.4, 0)
-            
-            _, buffer = cv2.imencode('.jpg', blended_frame)
-            return buffer.tobytes()
-
-    def _normalize_cam(self, cam: np.ndarray) -> np.ndarray:
-        cam -= cam.min()
-        cam /= cam.max()
-        return (cam * 255).astype(np.uint8)
\ No newline at end of file
+            scale = state.options.render_scale
+            size = (max(1, round(w * scale)), max(1, round(h * scale)))
+            small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            return self._blend(small, self._to_uint8(cam))
+        if render == 'roi':
+            return self._blend_region(frame, cam, state.options.roi_threshold)
+        return self._blend(frame, self._to_uint8(cam))
+
+    def _blend_region(self, frame: np.ndarray, cam: np.ndarray, threshold: float) -> np.ndarray:
+        """Blends only the bounding box of the map cells at or above ``threshold``."""
+        rows, cols = np.nonzero(cam >= threshold)
+        if rows.size == 0:
+            return frame
+        h, w = frame.shape[:2]
+        map_h, map_w = cam.shape
+        top, bottom = rows.min() * h // map_h, -(-(rows.max() + 1) * h // map_h)
+        left, right = cols.min() * w // map_w, -(-(cols.max() + 1) * w // map_w)
+        region_cam = cam[rows.min():rows.max() + 1, cols.min():cols.max() + 1]
+        frame[top:bottom, left:right] = self._blend(frame[top:bottom, left:right], self._to_uint8(region_cam))
+        return frame
+
+    def _blend(self, frame: np.ndarray, cam: np.ndarray) -> np.ndarray:
+        h, w = frame.shape[:2]
+        cam_resized = cv2.resize(cam, (w, h))
+        heatmap = cv2.applyColorMap(cam_resized, cv2.COLORMAP_JET)
+        return cv2.addWeighted(frame, 0.6, heatmap, 0.4, 0)
+
+    def _encode(self, frame: np.ndarray) -> bytes:
+        _, buffer = cv2.imencode('.jpg', frame)
+        return buffer.tobytes()
+
+    def _normalize_cams(self, cams: np.ndarray) -> np.ndarray:
+        cams -= cams.min(axis=(-2, -1), keepdims=True)
+        cams /= np.maximum(cams.max(axis=(-2, -1), keepdims=True), 1e-12)
+        return cams
+
+    def _to_uint8(self, cams: np.ndarray) -> np.ndarray:
+        return (cams * 255).astype(np.uint8)
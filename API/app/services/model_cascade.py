@@ -0,0 +1,105 @@
+import threading
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple
+import torch
+import torch.nn.functional as F
+from models.engines import EngineOutput, logits_of
+
+class CascadeOutput(NamedTuple):
+    probabilities: torch.Tensor
+    tiers: List[str]
+    # res2 features of the rows the full model answered, in the order of full_rows.
+    features: Optional[torch.Tensor]
+    full_rows: List[int]
+
+class ModelCascade:
+    """Scores a batch with a fast tier and reruns uncertain images on the full model.
+
+    The fast tier is the same ResNet9 fed a copy of the batch downscaled to
+    ``image_size``. Rows whose top softmax probability is below ``threshold``,
+    and rows the caller forces, are escalated to the full-resolution model.
+    A random ``shadow_rate`` share of the rows the fast tier answered also
+    runs on the full model; the answer is not changed, but the top-1
+    agreement is counted so the threshold can be tuned against the
+    always-full baseline.
+    """
+
+    def __init__(self, fast_model: Callable[[torch.Tensor], EngineOutput],
+                 full_model: Callable[[torch.Tensor], Tuple[Optional[torch.Tensor], torch.Tensor]],
+                 image_size: int, threshold: float, shadow_rate: float):
+        self.fast_model = fast_model
+        self.full_model = full_model
+        self.image_size = image_size
+        self.threshold = threshold
+        self.shadow_rate = shadow_rate
+        self.fast = 0
+        self.escalated = 0
+        self.forced = 0
+        self.shadow_agreed = 0
+        self.shadow_disagreed = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, xb: torch.Tensor, force_full: Sequence[bool]) -> CascadeOutput:
+        forced = torch.tensor(force_full, dtype=torch.bool)
+        confidences = torch.zeros(len(xb))
+        fast_preds = torch.zeros(len(xb), dtype=torch.long)
+        fast_probabilities = None
+        # Forced rows always run on the full model, so the fast tier only scores the others.
+        gated = (~forced).nonzero().flatten()
+        if len(gated):
+            small = F.interpolate(xb[gated], size=(self.image_size, self.image_size), mode='bilinear',
+                                  align_corners=False, antialias=True)
+            fast_probabilities = torch.softmax(logits_of(self.fast_model(small)), dim=1)
+            confidences[gated], fast_preds[gated] = fast_probabilities.max(dim=1)
+
+        low_confidence = (confidences < self.threshold) & ~forced
+        escalate = low_confidence | forced
+        shadow = ~escalate & (torch.rand(len(xb)) < self.shadow_rate)
+        rows = (escalate | shadow).nonzero().flatten().tolist()
+
+        row_features, full_probabilities = None, None
+        if rows:
+            row_features, logits = self.full_model(xb[rows])
+            full_probabilities = torch.softmax(logits, dim=1)
+        num_classes = (fast_probabilities if fast_probabilities is not None else full_probabilities).shape[1]
+        probabilities = torch.zeros(len(xb), num_classes)
+        if fast_probabilities is not None:
+            probabilities[gated] = fast_probabilities
+
+        tiers = ['fast'] * len(xb)
+        features, full_rows, answered = None, [], []
+        agreed = disagreed = 0
+        for j, row in enumerate(rows):
+            if escalate[row]:
+                probabilities[row] = full_probabilities[j]
+                tiers[row] = 'full'
+                full_rows.append(row)
+                answered.append(j)
+            elif full_probabilities[j].argmax() == fast_preds[row]:
+                agreed += 1
+            else:
+                disagreed += 1
+        if row_features is not None and answered:
+            features = row_features[answered]
+
+        with self._lock:
+            self.fast += len(xb) - len(full_rows)
+            self.escalated += int(low_confidence.sum())
+            self.forced += int(forced.sum())
+            self.shadow_agreed += agreed
+            self.shadow_disagreed += disagreed
+        return CascadeOutput(probabilities, tiers, features, full_rows)
+
+    def stats(self) -> dict:
+        gated = self.fast + self.escalated
+        shadowed = self.shadow_agreed + self.shadow_disagreed
+        return {
+            "image_size": self.image_size,
+            "threshold": self.threshold,
+            "shadow_rate": self.shadow_rate,
+            "fast": self.fast,
+            "escalated": self.escalated,
+            "forced": self.forced,
+            "escalation_rate": self.escalated / gated if gated else 0.0,
+            "shadow_samples": shadowed,
+            "shadow_agreement": self.shadow_agreed / shadowed if shadowed else None,
+        }
@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+from schemas.prediction import PredictionResult
+
+logger = logging.getLogger(__name__)
+
+def fingerprint(files: Iterable[str], settings: dict) -> str:
+    """Short hash of the given files' contents and settings.
+
+    Used to namespace the disk tier, so predictions made with other weights
+    or another inference configuration are never served.
+    """
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode())
+    for path in files:
+        try:
+            with open(path, 'rb') as f:
+                while chunk := f.read(1 << 20):
+                    digest.update(chunk)
+        except OSError:
+            digest.update(path.encode())
+    return digest.hexdigest()[:16]
+
+class PredictionCache:
+    """LRU cache of predictions keyed by the SHA-256 of the uploaded bytes.
+
+    Entries expire after ``ttl`` seconds. When ``disk_dir`` is set, results are
+    also written there as small JSON files so they survive restarts. They go
+    in a ``namespace`` subdirectory (see ``fingerprint``), so a restart with
+    new weights or settings starts from an empty disk tier. Disk writes are
+    best effort and run off the event loop.
+    """
+
+    def __init__(self, max_size: int, ttl: float, disk_dir: str = '', namespace: str = ''):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.disk_dir = os.path.join(disk_dir, namespace) if disk_dir and namespace else disk_dir
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[float, PredictionResult]]" = OrderedDict()
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def get(self, key: str) -> Optional[PredictionResult]:
+        entry = self._entries.get(key)
+        if entry is not None and not self._expired(entry[0]):
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            del self._entries[key]
+
+        entry = self._read_disk(key)
+        if entry is not None:
+            self._store(key, *entry)
+            self.hits += 1
+            self.disk_hits += 1
+            return entry[1]
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, result: PredictionResult) -> None:
+        created = time.time()
+        self._store(key, created, result)
+        if not self.disk_dir:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_disk(key, created, result)
+        else:
+            loop.run_in_executor(None, self._write_disk, key, created, result)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl > 0 and time.time() - created > self.ttl
+
+    def _store(self, key: str, created: float, result: PredictionResult) -> None:
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (created, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[Tuple[float, PredictionResult]]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            created = float(data["created"])
+            result = PredictionResult(**data["result"])
+        except (OSError, ValueError, KeyError, TypeError):
+            # Unreadable or malformed entries are treated as misses.
+            return None
+        if self._expired(created):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return created, result
+
+    def _write_disk(self, key: str, created: float, result: PredictionResult) -> None:
+        path = self._disk_path(key)
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # A private temporary file per writer: several workers may cache the same image at once.
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, "w") as f:
+                json.dump({"created": created, "result": result.model_dump()}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write prediction cache entry {path}: {e}")
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
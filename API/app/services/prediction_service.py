@@ -1,141 +1,330 @@
+import asyncio
 import logging
-import httpx
+import numpy as np
 import torch
-from typing import List
-from collections import Counter
+from typing import AsyncIterator, List, NamedTuple, Optional, Tuple, Union
 from models.resnet9 import load_plant_disease_model
-from utils.image_utils import transform_image
-from config.config import IN_CHANNELS, NUM_DISEASES, CLASS_NAMES
-from schemas.prediction import parse_class_name, PredictionResult, PlantHealthSummary
-from fastapi import UploadFile
-import time
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('nodemcu_connection.log'),
-        logging.StreamHandler()
-    ]
+from models.engines import LazyEngine, load_engine
+from models.weights import load_weights
+from utils.image_utils import RequestTooLargeError, UploadTooLargeError, read_upload, transform_bytes
+from utils.memory import MemoryProbe
+from utils.executor import run_inference
+from utils.explanation import class_activation_maps, encode_explanation
+from utils.metrics import BATCH_SIZE, ERRORS, stage_timer
+from config.logging_config import setup_logging
+from config.config import (
+    IN_CHANNELS, NUM_DISEASES, IMAGE_SIZE, CLASS_NAMES, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS,
+    PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL, PREDICTION_CACHE_DIR,
+    NODEMCU_URL, PUMP_QUEUE_SIZE, PUMP_TIMEOUT, PUMP_MAX_RETRIES, PUMP_RETRY_BACKOFF,
+    MAX_UPLOAD_BYTES, MAX_REQUEST_BYTES, STREAM_WINDOW, MODEL_PATH, INFERENCE_WORKERS,
+    CASCADE_ENABLED, CASCADE_IMAGE_SIZE, CASCADE_THRESHOLD, CASCADE_SHADOW_RATE, INFERENCE_BACKEND, FAST_DECODE
+)
+from schemas.prediction import (
+    parse_class_name, PredictionResult, PredictionResponse, PredictionResponseMulti, PlantHealthSummary
 )
+from services.batch_scheduler import InferenceBatcher
+from services.health_summary import HealthSummaryAccumulator
+from services.model_cascade import ModelCascade
+from services.prediction_cache import PredictionCache, fingerprint
+from services.pump_dispatcher import PumpDispatcher
+from fastapi import UploadFile
+
+setup_logging()
 logger = logging.getLogger(__name__)
 
+# A prediction and the class activation map of its class, when the engine returns features.
+Scored = Tuple[PredictionResult, Optional[np.ndarray]]
+
+class ScoreRequest(NamedTuple):
+    image: torch.Tensor
+    # Explained requests need full-resolution features, so they skip the cascade's fast tier.
+    explain: bool = False
+
 class PredictionService:
     def __init__(self):
-        self.model = load_plant_disease_model(IN_CHANNELS, NUM_DISEASES)
+        self.classifier_weight: Optional[torch.Tensor] = None
+        self.model = LazyEngine(self._load_model)
+        self.cascade: Optional[ModelCascade] = None
+        if CASCADE_ENABLED:
+            fast_model = LazyEngine(lambda: load_engine(
+                'resnet9_fast', lambda: load_plant_disease_model(IN_CHANNELS, NUM_DISEASES, global_pool=True)
+            ))
+            self.cascade = ModelCascade(fast_model, self._run_full, CASCADE_IMAGE_SIZE,
+                                        CASCADE_THRESHOLD, CASCADE_SHADOW_RATE)
+        self.batcher = InferenceBatcher(self._score_requests, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, INFERENCE_WORKERS)
+        self.cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL, PREDICTION_CACHE_DIR,
+                                     self._cache_namespace() if PREDICTION_CACHE_DIR else '')
+        self.pump = PumpDispatcher(NODEMCU_URL, PUMP_QUEUE_SIZE, PUMP_TIMEOUT, PUMP_MAX_RETRIES, PUMP_RETRY_BACKOFF)
+        self.request_memory = {"last_peak_bytes": 0, "max_peak_bytes": 0}
+
+    @staticmethod
+    def _cache_namespace() -> str:
+        """Identifies everything that changes a prediction for the same bytes."""
+        return fingerprint([MODEL_PATH], {
+            "backend": INFERENCE_BACKEND,
+            "fast_decode": FAST_DECODE,
+            "image_size": IMAGE_SIZE,
+            "cascade": [CASCADE_ENABLED, CASCADE_IMAGE_SIZE, CASCADE_THRESHOLD] if CASCADE_ENABLED else None,
+        })
 
-    async def predict(self, file) -> PredictionResult:
-        image = await transform_image(file)
+    def _load_model(self):
+        state_dict = load_weights(MODEL_PATH)
+        self.classifier_weight = state_dict['classifier.2.weight']
+        return load_engine('resnet9', lambda: load_plant_disease_model(IN_CHANNELS, NUM_DISEASES, return_features=True,
+                                                                       state_dict=state_dict))
+
+    def warmup(self) -> None:
+        """Loads the model (and the cascade's fast tier) and runs one image through it."""
+        image = torch.zeros(1, IN_CHANNELS, IMAGE_SIZE, IMAGE_SIZE)
+        self.model(image)
+        if self.cascade is not None:
+            self.cascade.fast_model(torch.zeros(1, IN_CHANNELS, CASCADE_IMAGE_SIZE, CASCADE_IMAGE_SIZE))
+
+    async def predict(self, file, explain: Optional[str] = None) -> PredictionResponse:
+        """Classifies one upload.
+
+        With ``explain`` (``array`` or ``png``) the response also carries the
+        class activation map of the predicted class, computed from the
+        ``res2`` feature maps of the same forward pass. Cached predictions
+        have no map, so explained requests always run the full model.
+        """
+        contents, key = await read_upload(file, MAX_UPLOAD_BYTES)
+        cached = self.cache.get(key) if explain is None else None
+        if cached is not None:
+            return PredictionResponse(prediction=cached)
+
+        image = await transform_bytes(contents)
+        del contents
+        result, cam = await self.batcher.submit(ScoreRequest(image, explain is not None))
+        self.cache.put(key, result)
+        explanation = encode_explanation(cam, explain) if explain is not None else None
+        return PredictionResponse(prediction=result, explanation=explanation)
+
+    def _run_full(self, xb: torch.Tensor) -> Tuple[Optional[torch.Tensor], torch.Tensor]:
+        outputs = self.model(xb)
+        # Artifacts exported before the engine returned features yield logits only.
+        return outputs if isinstance(outputs, tuple) else (None, outputs)
+
+    def _score_requests(self, requests: List[ScoreRequest]) -> List[Scored]:
+        BATCH_SIZE.observe(len(requests), pipeline='prediction')
         with torch.no_grad():
-            xb = image.unsqueeze(0)
-            outputs = self.model(xb)
-            _, preds = torch.max(outputs, dim=1)
-        
-        class_name = CLASS_NAMES[preds[0].item()]
+            with stage_timer('prediction', 'inference'):
+                xb = torch.stack([request.image for request in requests])
+                if self.cascade is not None:
+                    probabilities, tiers, features, full_rows = self.cascade(
+                        xb, [request.explain for request in requests]
+                    )
+                else:
+                    features, logits = self._run_full(xb)
+                    probabilities = torch.nn.functional.softmax(logits, dim=1)
+                    tiers, full_rows = [None] * len(requests), list(range(len(requests)))
+            with stage_timer('prediction', 'postprocess'):
+                confidences, preds = torch.max(probabilities, dim=1)
+                cams = [None] * len(requests)
+                if features is not None:
+                    maps = class_activation_maps(features, self.classifier_weight, preds[full_rows])
+                    for row, cam in zip(full_rows, maps):
+                        cams[row] = cam
+                return [
+                    (self._build_result(pred, confidence, tier), cam)
+                    for pred, confidence, tier, cam in zip(preds.tolist(), confidences.tolist(), tiers, cams)
+                ]
+
+    def _build_result(self, pred: int, confidence: float, tier: Optional[str] = None) -> PredictionResult:
+        class_name = CLASS_NAMES[pred]
         plant, condition = parse_class_name(class_name)
-        confidence = torch.nn.functional.softmax(outputs, dim=1)[0][preds[0]].item()
 
         return PredictionResult(
             class_name=class_name,
             plant=plant,
             condition=condition,
-            confidence=confidence
+            confidence=confidence,
+            tier=tier
         )
-    
-    async def control_pump(self, diseased_percentage: float) -> None:
-        mix1 = int((diseased_percentage * 100) / 1.7)
-        mix2 = mix1/2
-        nodemcu_url = "http://192.168.117.147/pump/action"
-        
-        logger.info(f"Attempting to connect to NodeMCU at {nodemcu_url}")
-        logger.info(f"Sending mix values - mix1: {mix1}, mix2: {mix2}")
-        
-        start_time = time.time()
-        async with httpx.AsyncClient() as client:
+
+    async def predict_batch(self, files: List[UploadFile], probe: Optional[MemoryProbe] = None,
+                            explain: Optional[str] = None) -> Tuple[List[dict], List[str]]:
+        """Reads, hashes and decodes one upload at a time.
+
+        Each raw buffer (and the upload's spool file) is released as soon as its
+        tensor exists, so only one undecoded image is held at any point. With
+        ``explain`` every item also carries an ``explanation``; like ``predict``
+        this bypasses cached results, which have no map.
+
+        Returns the predictions and the names of the files rejected for being
+        larger than ``MAX_UPLOAD_BYTES``; if every file was rejected or failed,
+        ``UploadTooLargeError`` is raised instead.
+        """
+        predictions = []
+        rejected = []
+        pending = []
+        budget = MAX_REQUEST_BYTES
+
+        for file in files:
+            logger.info(f"Processing file: {file.filename}")
             try:
-                response = await client.post(
-                    nodemcu_url,
-                    json={"mix1": mix1, "mix2": mix2},
-                    timeout=mix1/1000 + 5.0
-                )
-                
-                if response.status_code == 200:
-                    logger.info(f"NodeMCU Response: {response.text}")
-                else:
-                    logger.warning(f"NodeMCU returned non-200 status code: {response.status_code}")
-                    logger.warning(f"Response content: {response.text}")
-            
-            except httpx.ConnectError:
-                logger.error("Failed to connect to NodeMCU - Device might be offline or IP incorrect")
+                limit = min(MAX_UPLOAD_BYTES, budget)
+                try:
+                    contents, key = await read_upload(file, limit)
+                except UploadTooLargeError:
+                    if limit < MAX_UPLOAD_BYTES:
+                        raise RequestTooLargeError(f"Request is larger than {MAX_REQUEST_BYTES} bytes")
+                    raise
+                budget -= len(contents)
+                if probe is not None:
+                    probe.sample()
+
+                cached = self.cache.get(key) if explain is None else None
+                if cached is not None:
+                    predictions.append({"filename": file.filename, "prediction": cached})
+                    continue
+
+                item = {"filename": file.filename, "prediction": None}
+                image = await transform_bytes(contents)
+                del contents
+                pending.append((item, key, image))
+                predictions.append(item)
+            except RequestTooLargeError:
+                raise
+            except UploadTooLargeError as e:
+                ERRORS.inc(source='batch_file')
+                logger.warning(f"Rejected file {file.filename}: {str(e)}")
+                rejected.append(file.filename)
             except Exception as e:
-                logger.error(f"Servo control error: {str(e)}")
+                ERRORS.inc(source='batch_file')
+                logger.error(f"Error processing file {file.filename}: {str(e)}")
                 logger.exception("Detailed error information:")
+                continue
+            finally:
+                await file.close()
+                if probe is not None:
+                    probe.sample()
+
+        if pending:
+            requests = [ScoreRequest(image, explain is not None) for _, _, image in pending]
+            results = await run_inference(self._score_requests, requests)
+            for (item, key, _), (result, cam) in zip(pending, results):
+                item["prediction"] = result
+                if explain is not None:
+                    item["explanation"] = encode_explanation(cam, explain)
+                self.cache.put(key, result)
+            if probe is not None:
+                probe.sample()
 
-    async def analyze_batch(self, files: List[UploadFile]) -> PlantHealthSummary:
+        if rejected and not predictions:
+            raise UploadTooLargeError(f"No valid images; larger than {MAX_UPLOAD_BYTES} bytes: {', '.join(rejected)}")
+        return predictions, rejected
+    
+    def _record_memory(self, probe: MemoryProbe) -> None:
+        self.request_memory["last_peak_bytes"] = probe.peak_delta
+        self.request_memory["max_peak_bytes"] = max(self.request_memory["max_peak_bytes"], probe.peak_delta)
+        logger.info(f"Peak request memory growth: {probe.peak_delta / 2**20:.1f} MiB")
+
+    def control_pump(self, diseased_percentage: float) -> None:
+        mix1 = int((diseased_percentage * 100) / 1.7)
+        mix2 = mix1/2
+
+        logger.info(f"Queueing pump command for NodeMCU at {self.pump.url} - mix1: {mix1}, mix2: {mix2}")
+        self.pump.submit({"mix1": mix1, "mix2": mix2})
+
+    async def analyze_batch(self, files: List[UploadFile], explain: Optional[str] = None) -> PlantHealthSummary:
         logger.info(f"Starting batch analysis of {len(files)} files")
         
         if len(files) > 10:
             logger.warning("Request exceeded maximum allowed files (10)")
             raise ValueError("Maximum 10 images allowed per request.")
 
-        predictions = []
-        healthy_count = 0
-        diseased_count = 0
-        plant_list = []
-        condition_list = []
+        probe = MemoryProbe()
+        predictions, rejected = await self.predict_batch(files, probe, explain)
+        self._record_memory(probe)
+        accumulator = HealthSummaryAccumulator()
 
-        for file in files:
-            logger.info(f"Processing file: {file.filename}")
+        for item in predictions:
+            prediction = item["prediction"]
+            accumulator.add(prediction)
+            logger.info(f"Successfully processed {item['filename']} - Condition: {prediction.condition}")
+
+        summary = self._finish_batch(accumulator)
+        if rejected:
+            summary.rejected_files = rejected
+        if explain is not None:
+            summary.predictions = [PredictionResponseMulti(**item) for item in predictions]
+        return summary
+
+    async def stream_batch(self, files: List[UploadFile],
+                           explain: Optional[str] = None) -> AsyncIterator[Tuple[str, dict]]:
+        """Scores uploads and yields ``(event, payload)`` pairs as results arrive.
+
+        Emits a ``prediction`` event (a ``PredictionResponseMulti``) or an
+        ``error`` event per file in completion order, then one ``summary``
+        event. At most ``STREAM_WINDOW`` files are read and decoded at once;
+        their tensors go through the shared micro-batcher, so memory stays
+        bounded however many files the request carries. With ``explain`` each
+        prediction also carries its class activation map, as in ``predict``.
+        """
+        logger.info(f"Starting streaming batch analysis of {len(files)} files")
+        accumulator = HealthSummaryAccumulator()
+        probe = MemoryProbe()
+        window = asyncio.Semaphore(STREAM_WINDOW)
+        tasks = [asyncio.create_task(self._score_file(file, window, probe, explain)) for file in files]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                filename, result = await next_result
+                if isinstance(result, Exception):
+                    yield "error", {"filename": filename, "error": str(result)}
+                    continue
+                accumulator.add(result.prediction)
+                yield "prediction", result.model_dump(exclude_none=True)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._record_memory(probe)
+
+        try:
+            summary = self._finish_batch(accumulator)
+        except ValueError as e:
+            yield "error", {"error": str(e)}
+            return
+        yield "summary", summary.model_dump(exclude_none=True)
+
+    async def _score_file(self, file: UploadFile, window: asyncio.Semaphore, probe: MemoryProbe,
+                          explain: Optional[str] = None) -> Tuple[str, Union[PredictionResponseMulti, Exception]]:
+        async with window:
             try:
-                prediction = await self.predict(file)
-                predictions.append({
-                    "filename": file.filename,
-                    "prediction": prediction
-                })
-
-                plant_list.append(prediction.plant)
-                condition_list.append(prediction.condition)
-                
-                if prediction.condition.lower() == "healthy":
-                    healthy_count += 1
-                else:
-                    diseased_count += 1
-                    
-                logger.info(f"Successfully processed {file.filename} - Condition: {prediction.condition}")
-                
+                contents, key = await read_upload(file, MAX_UPLOAD_BYTES)
+                probe.sample()
+                result = self.cache.get(key) if explain is None else None
+                explanation = None
+                if result is None:
+                    image = await transform_bytes(contents)
+                    del contents
+                    result, cam = await self.batcher.submit(ScoreRequest(image, explain is not None))
+                    self.cache.put(key, result)
+                    if explain is not None:
+                        explanation = encode_explanation(cam, explain)
+                return file.filename, PredictionResponseMulti(
+                    filename=file.filename, prediction=result, explanation=explanation
+                )
             except Exception as e:
+                ERRORS.inc(source='batch_file')
                 logger.error(f"Error processing file {file.filename}: {str(e)}")
-                logger.exception("Detailed error information:")
-                continue
+                return file.filename, e
+            finally:
+                await file.close()
+                probe.sample()
 
-        total_plants = len(predictions)
-        if total_plants == 0:
+    def _finish_batch(self, accumulator: HealthSummaryAccumulator) -> PlantHealthSummary:
+        if accumulator.total == 0:
             logger.error("No valid predictions were made in the batch")
-            raise ValueError("No valid predictions were made")
-
-        healthy_percentage = (healthy_count / total_plants) * 100
-        diseased_percentage = (diseased_count / total_plants) * 100
+        summary = accumulator.summary()
 
         logger.info(f"Batch analysis complete - "
-                   f"Total: {total_plants}, "
-                   f"Healthy: {healthy_count}, "
-                   f"Diseased: {diseased_count}, "
-                   f"Diseased Percentage: {diseased_percentage:.2f}%")
-
-        most_common_plant = str(Counter(plant_list).most_common(1)[0][0])
-        non_healthy_conditions = [cond for cond in condition_list if cond != "healthy"]
-        most_common_condition = str(Counter(non_healthy_conditions).most_common(1)[0][0]) if non_healthy_conditions else "healthy"
-
-        logger.info(f"Initiating pump control with diseased percentage: {diseased_percentage:.2f}%")
-        await self.control_pump(diseased_percentage)
-
-        return PlantHealthSummary(
-            total_plants=total_plants,
-            healthy_count=healthy_count,
-            diseased_count=diseased_count,
-            healthy_percentage=healthy_percentage,
-            diseased_percentage=diseased_percentage,
-            condition=most_common_condition,
-            plant=most_common_plant 
-        )
\ No newline at end of file
+                   f"Total: {summary.total_plants}, "
+                   f"Healthy: {summary.healthy_count}, "
+                   f"Diseased: {summary.diseased_count}, "
+                   f"Diseased Percentage: {summary.diseased_percentage:.2f}%")
+
+        logger.info(f"Initiating pump control with diseased percentage: {summary.diseased_percentage:.2f}%")
+        self.control_pump(summary.diseased_percentage)
+        return summary
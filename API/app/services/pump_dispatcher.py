@@ -0,0 +1,148 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Optional
+import httpx
+from utils.metrics import ERRORS, stage_timer
+
+logger = logging.getLogger(__name__)
+
+class PumpDispatcher:
+    """Sends pump commands to the NodeMCU in the background.
+
+    Commands go into a bounded queue drained by a single worker that reuses one
+    pooled HTTP client. A command identical to the one already waiting at the
+    tail of the queue is coalesced into it; when the queue is full the oldest
+    command is dropped. Connection failures and 5xx responses are retried with
+    exponential backoff; other errors, such as a read timeout after the
+    command may already have started the pump, are not. A 409 means the pump
+    is still running, so it is retried until the longer of the two mix
+    durations (of this command or the last one sent) has passed.
+    """
+
+    def __init__(self, url: str, max_queue: int, timeout: float, max_retries: int, backoff: float):
+        self.url = url
+        self.max_queue = max(1, max_queue)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self._pending: Deque[dict] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._busy_until = 0.0
+
+    def submit(self, command: dict) -> None:
+        self._ensure_worker()
+        if self._pending and self._pending[-1] == command:
+            self.coalesced += 1
+            return
+        if len(self._pending) >= self.max_queue:
+            self._pending.popleft()
+            self.dropped += 1
+        self._pending.append(command)
+        self._wakeup.set()
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "queue_depth": len(self._pending),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+        }
+
+    async def close(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=1, max_keepalive_connections=1)
+            )
+            self._worker = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending:
+                with stage_timer('prediction', 'pump_dispatch'):
+                    await self._send(self._pending.popleft())
+
+    async def _send(self, command: dict) -> None:
+        loop = asyncio.get_running_loop()
+        failures = busy = 0
+        busy_until = None
+        while True:
+            try:
+                response = await self._client.post(self.url, json=command)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                # The command never reached the NodeMCU, so sending it again is safe.
+                failures += 1
+                logger.warning(f"NodeMCU request failed (attempt {failures + busy}): {e!r}")
+                if failures > self.max_retries:
+                    break
+                await self._retry_after(self.backoff * 2 ** (failures - 1))
+                continue
+            except httpx.HTTPError as e:
+                # It may have started the pump already; resending could dose the plants twice.
+                logger.error(f"NodeMCU request for {command} failed and is not retried: {e!r}")
+                self._fail()
+                return
+
+            if response.status_code == 200:
+                self.sent += 1
+                self._busy_until = loop.time() + self._run_seconds(command)
+                logger.info(f"NodeMCU Response: {response.text}")
+                return
+            if response.status_code == 409:
+                # The pump is still running a previous command; keep trying for as long as a run lasts.
+                busy += 1
+                now = loop.time()
+                if busy_until is None:
+                    busy_until = max(self._busy_until, now + self._run_seconds(command))
+                logger.warning(f"NodeMCU is busy (attempt {failures + busy}): {response.text}")
+                if now >= busy_until:
+                    break
+                await self._retry_after(min(self.backoff * 2 ** (busy - 1), busy_until - now))
+                continue
+            if response.status_code < 500:
+                logger.warning(f"NodeMCU rejected command {command} with {response.status_code}: {response.text}")
+                self._fail()
+                return
+            failures += 1
+            logger.warning(f"NodeMCU returned {response.status_code} (attempt {failures + busy}): {response.text}")
+            if failures > self.max_retries:
+                break
+            await self._retry_after(self.backoff * 2 ** (failures - 1))
+
+        logger.error(f"Giving up on pump command {command} after {failures + busy} attempts")
+        self._fail()
+
+    async def _retry_after(self, seconds: float) -> None:
+        self.retries += 1
+        await asyncio.sleep(seconds)
+
+    def _fail(self) -> None:
+        self.failed += 1
+        ERRORS.inc(source='pump')
+
+    @staticmethod
+    def _run_seconds(command: dict) -> float:
+        return max(float(command.get('mix1', 0)), float(command.get('mix2', 0))) / 1000
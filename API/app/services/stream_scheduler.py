@@ -0,0 +1,112 @@
+import asyncio
+from collections import Counter, OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+from services.heatmap_service import HeatmapService
+from services.stream_state import StreamState
+
+class FairFrameScheduler:
+    """Shares model time round-robin across streams.
+
+    Each stream has at most one pending frame; a newer frame replaces it.
+    Streams are served in the order they became ready and go to the back of
+    the line once served, so a fast sender cannot starve the others. The
+    latest frames of up to ``max_batch_size`` streams are run through the CAM
+    model together as one batch; a batch only takes streams whose model input
+    size matches that of the stream at the front of the line.
+    """
+
+    def __init__(self, heatmap_service: HeatmapService, concurrency: int = 1, max_batch_size: int = 1):
+        self.heatmap_service = heatmap_service
+        self.concurrency = max(1, concurrency)
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_sizes = Counter()
+        self.frames_processed: Dict[Hashable, int] = {}
+        self._pending: "OrderedDict[Hashable, Tuple[bytes, Optional[StreamState], asyncio.Future]]" = OrderedDict()
+        self._ready: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def process(self, stream_id: Hashable, frame_bytes: bytes, state: Optional[StreamState] = None) -> bytes:
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        self.frames_processed.setdefault(stream_id, 0)
+        previous = self._pending.pop(stream_id, None)
+        if previous is not None and not previous[-1].done():
+            previous[-1].cancel()
+        self._pending[stream_id] = (frame_bytes, state, future)
+        self._ready.set()
+        return await future
+
+    def remove(self, stream_id: Hashable) -> None:
+        pending = self._pending.pop(stream_id, None)
+        if pending is not None and not pending[-1].done():
+            pending[-1].cancel()
+        self.frames_processed.pop(stream_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "pending_frames": len(self._pending),
+            "frames_per_stream": list(self.frames_processed.values()),
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+        }
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._ready = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._worker = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await self._ready.wait()
+            await self._slots.acquire()
+            batch = self._take_batch()
+            if not batch:
+                self._ready.clear()
+                self._slots.release()
+                continue
+            asyncio.create_task(self._process_batch(batch))
+
+    def _take_batch(self) -> List[Tuple[Hashable, bytes, Optional[StreamState], asyncio.Future]]:
+        batch = []
+        size = None
+        for stream_id in list(self._pending):
+            if len(batch) >= self.max_batch_size:
+                break
+            frame_bytes, state, future = self._pending[stream_id]
+            if future.done():
+                del self._pending[stream_id]
+                continue
+            frame_size = self._input_size(state)
+            if size is None:
+                size = frame_size
+            elif frame_size != size:
+                continue
+            del self._pending[stream_id]
+            batch.append((stream_id, frame_bytes, state, future))
+        return batch
+
+    def _input_size(self, state: Optional[StreamState]) -> Tuple[int, int]:
+        return state.input_size if state is not None else self.heatmap_service.default_size
+
+    async def _process_batch(self, batch: List[Tuple[Hashable, bytes, Optional[StreamState], asyncio.Future]]) -> None:
+        self.batch_sizes[len(batch)] += 1
+        try:
+            results = await self.heatmap_service.process_frames(
+                [frame_bytes for _, frame_bytes, _, _ in batch],
+                states=[state for _, _, state, _ in batch]
+            )
+        except Exception as e:
+            results = [e] * len(batch)
+        finally:
+            self._slots.release()
+
+        for (stream_id, _, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+                continue
+            future.set_result(result)
+            if stream_id in self.frames_processed:
+                self.frames_processed[stream_id] += 1
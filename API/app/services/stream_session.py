@@ -0,0 +1,123 @@
+import asyncio
+from typing import Optional, Union
+from fastapi import WebSocket
+from config.websocket_config import WebSocketConfig
+from services.stream_scheduler import FairFrameScheduler
+from services.stream_state import StreamOptions, StreamState
+from utils.frame_processing import FrameProcessor
+from utils.metrics import WEBSOCKET_FRAMES
+
+class LatestFrameSlot:
+    """One-slot buffer: a new frame replaces any frame not yet processed."""
+
+    def __init__(self):
+        self._frame: Optional[Union[bytes, str]] = None
+        self._event = asyncio.Event()
+        self.dropped = 0
+
+    def put(self, frame: Union[bytes, str]) -> None:
+        if self._frame is not None:
+            self.dropped += 1
+            WEBSOCKET_FRAMES.inc(outcome='dropped')
+        self._frame = frame
+        self._event.set()
+
+    async def get(self) -> Union[bytes, str]:
+        await self._event.wait()
+        self._event.clear()
+        frame, self._frame = self._frame, None
+        return frame
+
+class HeatmapStreamSession:
+    """Per-connection pipeline with independent receive and process tasks.
+
+    The receiver never waits for the model, so frames that arrive while one is
+    being processed overwrite each other and only the latest is processed.
+    Processing is capped at ``FRAME_RATE`` frames per second.
+    """
+
+    def __init__(self, websocket: WebSocket, scheduler: FairFrameScheduler,
+                 config: WebSocketConfig, binary: bool, options: Optional[StreamOptions] = None):
+        self.websocket = websocket
+        self.scheduler = scheduler
+        self.binary = binary
+        self.config = config
+        options = options or StreamOptions()
+        # Connections on the default path carry no state, so they batch and
+        # render exactly as before.
+        self.state = None if options.is_default else StreamState(options, config)
+        self.slot = LatestFrameSlot()
+        self.processed = 0
+        self._last_report_time = 0.0
+        self._last_report_count = 0
+
+    async def run(self) -> None:
+        tasks = {
+            asyncio.create_task(self._receive_loop()),
+            asyncio.create_task(self._process_loop()),
+        }
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            try:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            finally:
+                # Runs even when the session itself is cancelled while waiting here.
+                self.scheduler.remove(id(self))
+        for task in done:
+            task.result()
+
+    async def _receive_loop(self) -> None:
+        while True:
+            if self.binary:
+                self.slot.put(await self.websocket.receive_bytes())
+            else:
+                self.slot.put(await self.websocket.receive_text())
+
+    async def _process_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        min_interval = 1 / self.config.FRAME_RATE if self.config.FRAME_RATE > 0 else 0.0
+        self._last_report_time = loop.time()
+
+        while True:
+            frame = await self.slot.get()
+            started = loop.time()
+            try:
+                frame_bytes = frame if self.binary else FrameProcessor.decode_frame(frame)
+                processed_frame = await self.scheduler.process(id(self), frame_bytes, self.state)
+                if self.state is not None:
+                    self.state.record_latency(loop.time() - started)
+                if self.binary:
+                    await self.websocket.send_bytes(processed_frame)
+                else:
+                    await self.websocket.send_text(FrameProcessor.encode_frame(processed_frame))
+                self.processed += 1
+                WEBSOCKET_FRAMES.inc(outcome='processed')
+            except ValueError as e:
+                WEBSOCKET_FRAMES.inc(outcome='error')
+                await self.websocket.send_json({"error": str(e)})
+
+            await self._maybe_report_stats(loop.time())
+            elapsed = loop.time() - started
+            if elapsed < min_interval:
+                await asyncio.sleep(min_interval - elapsed)
+
+    async def _maybe_report_stats(self, now: float) -> None:
+        elapsed = now - self._last_report_time
+        if elapsed < self.config.STATS_INTERVAL:
+            return
+        await self.websocket.send_json({"stats": self.stats(elapsed)})
+        self._last_report_time = now
+        self._last_report_count = self.processed
+
+    def stats(self, elapsed: float) -> dict:
+        stats = {
+            "processed_fps": (self.processed - self._last_report_count) / elapsed if elapsed > 0 else 0.0,
+            "processed_frames": self.processed,
+            "dropped_frames": self.slot.dropped,
+        }
+        if self.state is not None:
+            stats.update(self.state.stats())
+        return stats
@@ -0,0 +1,152 @@
+from typing import List, Literal, Mapping, Optional, Tuple
+import cv2
+import numpy as np
+from pydantic import BaseModel, Field
+from config.websocket_config import WebSocketConfig
+
+Size = Tuple[int, int]
+
+class StreamOptions(BaseModel):
+    """Per-connection heatmap modes, chosen with websocket query parameters.
+
+    The defaults reproduce the fixed path: every frame is resized to
+    ``FRAME_HEIGHT x FRAME_WIDTH``, run through the model and blended at full
+    resolution.
+    """
+    adaptive: bool = False
+    target_ms: float = Field(default=100.0, gt=0)
+    render: Literal['full', 'reduced', 'roi'] = 'full'
+    render_scale: float = Field(default=0.5, gt=0, le=1)
+    roi_threshold: float = Field(default=0.5, ge=0, le=1)
+    temporal: bool = False
+    change_threshold: float = Field(default=3.0, ge=0)
+    ema: float = Field(default=0.0, ge=0, lt=1)
+
+    @classmethod
+    def from_query(cls, params: Mapping[str, str], config: WebSocketConfig) -> "StreamOptions":
+        """``?quality=adaptive&target_ms=80&render=roi&temporal=1&ema=0.5``"""
+        values = {
+            'target_ms': config.TARGET_LATENCY_MS,
+            'render_scale': config.RENDER_SCALE,
+            'roi_threshold': config.ROI_THRESHOLD,
+            'change_threshold': config.CHANGE_THRESHOLD,
+        }
+        values.update({name: params[name] for name in cls.model_fields if name in params})
+        if params.get('quality') == 'adaptive':
+            values['adaptive'] = True
+        return cls(**values)
+
+    @property
+    def is_default(self) -> bool:
+        return not self.adaptive and not self.temporal and self.render == 'full' and self.ema == 0
+
+def resolution_levels(config: WebSocketConfig) -> List[Size]:
+    """Model input sizes from full quality down, rounded to the backbone's stride of 32."""
+    levels = []
+    for scale in config.RESOLUTION_SCALES:
+        size = (
+            max(64, int(round(config.FRAME_HEIGHT * scale / 32)) * 32),
+            max(64, int(round(config.FRAME_WIDTH * scale / 32)) * 32),
+        )
+        if size not in levels:
+            levels.append(size)
+    levels[0] = (config.FRAME_HEIGHT, config.FRAME_WIDTH)
+    return levels
+
+class StreamState:
+    """State a connection carries into ``HeatmapService`` with each frame.
+
+    Adaptive mode steps the model input down through ``resolution_levels``
+    while the smoothed per-frame latency is over ``target_ms`` and back up
+    when it is well under. Temporal mode keeps a small grayscale thumbnail
+    of the last frame that went through the model; while new frames differ
+    from it by less than ``change_threshold`` (mean absolute difference on a
+    0-255 scale) its activation map is reused and only the blend is redone.
+
+    Only one frame per connection is in flight at a time, so the state is
+    never updated concurrently.
+    """
+
+    LATENCY_SMOOTHING = 0.3
+    STEP_UP_RATIO = 0.6
+    COOLDOWN_FRAMES = 5
+
+    def __init__(self, options: StreamOptions, config: WebSocketConfig):
+        self.options = options
+        self.config = config
+        self.sizes = resolution_levels(config) if options.adaptive else [(config.FRAME_HEIGHT, config.FRAME_WIDTH)]
+        self.level = 0
+        self.latency_ms: Optional[float] = None
+        self._frames_since_change = 0
+        self.thumbnail: Optional[np.ndarray] = None
+        self.cam: Optional[np.ndarray] = None
+        self.frames = 0
+        self.reused = 0
+
+    @property
+    def input_size(self) -> Size:
+        return self.sizes[self.level]
+
+    def record_latency(self, seconds: float) -> None:
+        if not self.options.adaptive:
+            return
+        latency_ms = seconds * 1000
+        if self.latency_ms is None:
+            self.latency_ms = latency_ms
+        else:
+            self.latency_ms += self.LATENCY_SMOOTHING * (latency_ms - self.latency_ms)
+
+        self._frames_since_change += 1
+        if self._frames_since_change < self.COOLDOWN_FRAMES:
+            return
+        if self.latency_ms > self.options.target_ms and self.level < len(self.sizes) - 1:
+            self._change_level(self.level + 1)
+        elif self.latency_ms < self.options.target_ms * self.STEP_UP_RATIO and self.level > 0:
+            self._change_level(self.level - 1)
+
+    def _change_level(self, level: int) -> None:
+        self.level = level
+        self.latency_ms = None
+        self._frames_since_change = 0
+
+    def make_thumbnail(self, frame: np.ndarray) -> Optional[np.ndarray]:
+        if not self.options.temporal:
+            return None
+        h, w = frame.shape[:2]
+        width = self.config.CHANGE_THUMBNAIL_WIDTH
+        height = max(1, round(h * width / w))
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, (width, height), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def reusable_cam(self, thumbnail: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        """Counts the frame and returns the previous map if the scene has not changed."""
+        self.frames += 1
+        if thumbnail is None or self.thumbnail is None or self.cam is None:
+            return None
+        if thumbnail.shape != self.thumbnail.shape:
+            return None
+        if np.abs(thumbnail - self.thumbnail).mean() >= self.options.change_threshold:
+            return None
+        self.reused += 1
+        return self.cam
+
+    def update(self, cam: np.ndarray, thumbnail: Optional[np.ndarray]) -> np.ndarray:
+        """Stores a freshly computed map, smoothed with the previous one if ``ema`` is set."""
+        if self.options.ema > 0 and self.cam is not None:
+            previous = self.cam
+            if previous.shape != cam.shape:
+                previous = cv2.resize(previous, (cam.shape[1], cam.shape[0]))
+            cam = self.options.ema * previous + (1 - self.options.ema) * cam
+        self.cam = cam
+        self.thumbnail = thumbnail
+        return cam
+
+    def stats(self) -> dict:
+        stats = {}
+        if self.options.adaptive:
+            stats["input_size"] = list(self.input_size)
+            stats["latency_ms"] = self.latency_ms
+        if self.options.temporal:
+            stats["reused_frames"] = self.reused
+            stats["skip_ratio"] = self.reused / self.frames if self.frames else 0.0
+        return stats
@@ -0,0 +1,219 @@
+"""Scores a folder of leaf photos offline with ResNet9.
+
+Run from the ``app`` directory::
+
+    python -m tools.batch_score /data/archive --output scores.csv --workers 8
+
+Images are decoded by DataLoader workers and scored in batches with the
+configured inference backend. Results stream to CSV, JSONL or Parquet (a
+directory of part files) and progress is checkpointed next to the output, so
+re-running the same command resumes where an interrupted run stopped.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import time
+from typing import List, Optional
+import torch
+from torch.utils.data import DataLoader, Dataset
+from config.config import CLASS_NAMES, IN_CHANNELS, INFERENCE_BACKEND, INFERENCE_SERVERS, NUM_DISEASES
+from models.engines import load_engine, logits_of
+from models.resnet9 import load_plant_disease_model
+from schemas.prediction import parse_class_name
+from utils.image_utils import decode_image_fast, decode_image_pil
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+FIELDS = ['path', 'class_name', 'plant', 'condition', 'confidence', 'error']
+PART_NAME = re.compile(r'part-(\d{5})\.parquet')
+
+class ImagePathDataset(Dataset):
+    def __init__(self, paths: List[str], fast_decode: bool):
+        self.paths = paths
+        self.decode = decode_image_fast if fast_decode else decode_image_pil
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        try:
+            with open(self.paths[index], 'rb') as f:
+                return index, self.decode(f.read()), None
+        except Exception as e:
+            return index, None, str(e)
+
+def collate(items):
+    images = [image for _, image, _ in items if image is not None]
+    return {
+        'indices': [index for index, image, _ in items if image is not None],
+        'images': torch.stack(images) if images else None,
+        'errors': [(index, error) for index, image, error in items if image is None],
+    }
+
+class ResultWriter:
+    """Appends result rows and reports the durable position for checkpoints."""
+
+    def __init__(self, path: str, fmt: str, resume_position: Optional[int]):
+        self.path = path
+        self.format = fmt
+        self._rows = []
+        self._file = None
+        self._csv = None
+
+        if fmt == 'parquet':
+            os.makedirs(path, exist_ok=True)
+            self.part = resume_position or 0
+            for name in os.listdir(path):
+                match = PART_NAME.fullmatch(name)
+                if match and int(match.group(1)) >= self.part:
+                    os.remove(os.path.join(path, name))
+            return
+
+        exists = resume_position is not None and os.path.exists(path)
+        self._file = open(path, 'r+' if exists else 'w', newline='')
+        if exists:
+            self._file.truncate(resume_position)
+            self._file.seek(resume_position)
+        if fmt == 'csv':
+            self._csv = csv.DictWriter(self._file, fieldnames=FIELDS)
+            if not exists:
+                self._csv.writeheader()
+
+    def write(self, rows: List[dict]) -> None:
+        if self.format == 'parquet':
+            self._rows.extend(rows)
+        elif self.format == 'csv':
+            self._csv.writerows(rows)
+        else:
+            self._file.writelines(json.dumps(row) + '\n' for row in rows)
+
+    def flush(self) -> int:
+        if self.format == 'parquet':
+            if self._rows:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+                schema = pa.schema([(field, pa.float64() if field == 'confidence' else pa.string())
+                                    for field in FIELDS])
+                table = pa.Table.from_pylist(self._rows, schema=schema)
+                pq.write_table(table, os.path.join(self.path, f'part-{self.part:05d}.parquet'))
+                self.part += 1
+                self._rows = []
+            return self.part
+
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+def list_images(directory: str) -> List[str]:
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(paths)
+
+def load_checkpoint(path: str, input_dir: str, total: int) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('input_dir') != os.path.abspath(input_dir) or checkpoint.get('total') != total:
+        raise SystemExit(f"{path} belongs to a different run; delete it or choose another --output")
+    return checkpoint
+
+def save_checkpoint(path: str, state: dict) -> None:
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+def result_row(path: str, pred: int, confidence: float) -> dict:
+    class_name = CLASS_NAMES[pred]
+    plant, condition = parse_class_name(class_name)
+    return {'path': path, 'class_name': class_name, 'plant': plant,
+            'condition': condition, 'confidence': confidence, 'error': None}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input_dir')
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--format', choices=['csv', 'jsonl', 'parquet'],
+                        help="Defaults to the output file extension")
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--threads', type=int, default=None, help="torch intra-op threads for inference")
+    parser.add_argument('--checkpoint-every', type=int, default=20, help="Batches between checkpoints")
+    parser.add_argument('--fast-decode', action='store_true')
+    parser.add_argument('--no-resume', action='store_true')
+    args = parser.parse_args()
+
+    fmt = args.format or os.path.splitext(args.output)[1].lstrip('.').lower()
+    if fmt not in ('csv', 'jsonl', 'parquet'):
+        parser.error("cannot infer --format from the output name")
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    paths = list_images(args.input_dir)
+    checkpoint_path = f'{args.output.rstrip(os.sep)}.checkpoint.json'
+    checkpoint = None if args.no_resume else load_checkpoint(checkpoint_path, args.input_dir, len(paths))
+    if checkpoint and not os.path.exists(args.output):
+        print(f"{args.output} is missing; ignoring {checkpoint_path} and starting over")
+        checkpoint = None
+    start = checkpoint['completed'] if checkpoint else 0
+    print(f"{len(paths)} images, {start} already scored")
+    if start >= len(paths):
+        return
+
+    # Exported artifacts and remote servers take CPU tensors; only the eager model is moved to the GPU.
+    on_gpu = INFERENCE_BACKEND == 'eager' and not INFERENCE_SERVERS and torch.cuda.is_available()
+    device = torch.device('cuda' if on_gpu else 'cpu')
+    model = load_engine('resnet9', lambda: load_plant_disease_model(IN_CHANNELS, NUM_DISEASES).to(device))
+    remaining = paths[start:]
+    loader = DataLoader(
+        ImagePathDataset(remaining, args.fast_decode),
+        batch_size=args.batch_size,
+        num_workers=args.workers,
+        collate_fn=collate,
+        pin_memory=device.type == 'cuda',
+        persistent_workers=args.workers > 0,
+        prefetch_factor=4 if args.workers > 0 else None,
+    )
+    writer = ResultWriter(args.output, fmt, checkpoint['position'] if checkpoint else None)
+
+    completed = start
+    started = time.perf_counter()
+    try:
+        for batch_number, batch in enumerate(loader, 1):
+            rows = {}
+            if batch['images'] is not None:
+                outputs = logits_of(model(batch['images'].to(device, non_blocking=True)))
+                confidences, preds = torch.softmax(outputs.float(), dim=1).max(dim=1)
+                for index, pred, confidence in zip(batch['indices'], preds.tolist(), confidences.tolist()):
+                    rows[index] = result_row(remaining[index], pred, confidence)
+            for index, error in batch['errors']:
+                rows[index] = {field: None for field in FIELDS} | {'path': remaining[index], 'error': error}
+
+            writer.write([rows[index] for index in sorted(rows)])
+            completed += len(rows)
+
+            if batch_number % args.checkpoint_every == 0 or completed == len(paths):
+                position = writer.flush()
+                save_checkpoint(checkpoint_path, {
+                    'input_dir': os.path.abspath(args.input_dir),
+                    'total': len(paths),
+                    'completed': completed,
+                    'position': position,
+                })
+                rate = (completed - start) / (time.perf_counter() - started)
+                print(f"{completed}/{len(paths)} images, {rate:.1f} images/sec")
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Scored {completed - start} images in {elapsed:.1f}s ({(completed - start) / elapsed:.1f} images/sec)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+"""Benchmarks the prediction and heatmap hot paths on synthetic images.
+
+Run from the ``app`` directory::
+
+    python -m tools.benchmark --output bench.json
+    python -m tools.benchmark --output new.json --compare bench.json
+
+Every stage (decode, preprocess, forward, softmax, CAM, colormap/blend, JPEG
+encode and the end-to-end service calls) is timed at phone and webcam
+resolutions across the requested batch sizes and torch thread counts.
+Results include p50/p95/p99 latency, throughput and peak RSS growth, and are
+written as JSON so runs from different commits can be compared.
+"""
+import os
+
+# Repeated uploads of the same synthetic image must not be served from cache.
+os.environ.setdefault('PREDICTION_CACHE_SIZE', '0')
+# Never reach the real pump controller from a benchmark, whatever the environment says.
+os.environ['NODEMCU_URL'] = 'http://127.0.0.1:9/pump/action'
+
+import argparse
+import asyncio
+import datetime
+import io
+import json
+import platform
+import subprocess
+import time
+from typing import Callable, Dict, List, Optional
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+from starlette.datastructures import UploadFile
+from models.engines import logits_of
+from schemas.prediction import PlantHealthSummary
+from services.health_summary import HealthSummaryAccumulator
+from utils.executor import get_inference_executor
+from utils.image_utils import decode_image_fast, transform
+from utils.memory import current_rss, peak_rss, reset_peak_rss
+
+RESOLUTIONS = {
+    'phone': (4032, 3024),
+    'webcam': (640, 480),
+}
+GROUPS = ('prediction', 'heatmap', 'websocket')
+
+def synthetic_jpeg(width: int, height: int, seed: int = 0) -> bytes:
+    """Smooth coloured noise, which compresses and decodes like a real photo."""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, size=(max(1, height // 32), max(1, width // 32), 3), dtype=np.uint8)
+    image = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return buffer.tobytes()
+
+def measure(fn: Callable[[], object], repeats: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        fn()
+    reset_peak_rss()
+    baseline = current_rss()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    peak = peak_rss()
+    return {
+        'times': times,
+        'peak_rss_mb': (peak - baseline) / 2**20 if peak is not None and baseline is not None else None,
+    }
+
+class Benchmark:
+    def __init__(self, repeats: int, warmup: int):
+        self.repeats = repeats
+        self.warmup = warmup
+        self.results: List[dict] = []
+        self.threads = torch.get_num_threads()
+
+    def run(self, group: str, stage: str, resolution: str, batch_size: int, fn: Callable[[], object]) -> None:
+        measured = measure(fn, self.repeats, self.warmup)
+        times_ms = np.array(measured['times']) * 1000
+        mean_ms = float(times_ms.mean())
+        result = {
+            'group': group,
+            'stage': stage,
+            'resolution': resolution,
+            'batch_size': batch_size,
+            'threads': self.threads,
+            'p50_ms': float(np.percentile(times_ms, 50)),
+            'p95_ms': float(np.percentile(times_ms, 95)),
+            'p99_ms': float(np.percentile(times_ms, 99)),
+            'mean_ms': mean_ms,
+            'throughput_per_s': batch_size / (mean_ms / 1000) if mean_ms > 0 else 0.0,
+            'peak_rss_mb': measured['peak_rss_mb'],
+        }
+        self.results.append(result)
+        print(f"{group:<11}{stage:<15}{resolution:<8}b={batch_size:<4}t={self.threads:<3}"
+              f"p50 {result['p50_ms']:9.2f} ms  p95 {result['p95_ms']:9.2f} ms  "
+              f"p99 {result['p99_ms']:9.2f} ms  {result['throughput_per_s']:9.1f}/s  "
+              f"peak +{result['peak_rss_mb'] or 0:.1f} MiB", flush=True)
+
+def _upload(contents: bytes, name: str = 'leaf.jpg') -> UploadFile:
+    return UploadFile(io.BytesIO(contents), filename=name, size=len(contents))
+
+async def _summarize_batch(service, files: List[UploadFile]) -> PlantHealthSummary:
+    """``analyze_batch`` without the pump command at the end."""
+    accumulator = HealthSummaryAccumulator()
+    predictions, _ = await service.predict_batch(files)
+    for item in predictions:
+        accumulator.add(item["prediction"])
+    return accumulator.summary()
+
+def bench_prediction(bench: Benchmark, loop, images: Dict[str, bytes], batch_sizes: List[int]) -> None:
+    from services.prediction_service import PredictionService
+    service = PredictionService()
+
+    for resolution, contents in images.items():
+        pil_image = Image.open(io.BytesIO(contents)).convert('RGB')
+        tensor = transform(pil_image)
+        bench.run('prediction', 'decode', resolution, 1,
+                  lambda: Image.open(io.BytesIO(contents)).convert('RGB'))
+        bench.run('prediction', 'preprocess', resolution, 1, lambda: transform(pil_image))
+        bench.run('prediction', 'decode_fast', resolution, 1, lambda: decode_image_fast(contents))
+        bench.run('prediction', 'predict', resolution, 1,
+                  lambda: loop.run_until_complete(service.predict(_upload(contents))))
+
+        for batch_size in batch_sizes:
+            batch = tensor.unsqueeze(0).repeat(batch_size, 1, 1, 1)
+            outputs = logits_of(service.model(batch))
+            bench.run('prediction', 'forward', resolution, batch_size, lambda: service.model(batch))
+            bench.run('prediction', 'softmax', resolution, batch_size,
+                      lambda: torch.softmax(outputs, dim=1).max(dim=1))
+            bench.run('prediction', 'analyze_batch', resolution, batch_size,
+                      lambda: loop.run_until_complete(_summarize_batch(
+                          service, [_upload(contents, f'{i}.jpg') for i in range(batch_size)])))
+
+def bench_heatmap(bench: Benchmark, loop, images: Dict[str, bytes], batch_sizes: List[int]) -> None:
+    from services.heatmap_service import HeatmapService
+    service = HeatmapService()
+
+    for resolution, contents in images.items():
+        frame = service._decode_frame(contents)
+        tensor = service._to_tensor(frame)
+        bench.run('heatmap', 'decode', resolution, 1, lambda: service._decode_frame(contents))
+        bench.run('heatmap', 'preprocess', resolution, 1, lambda: service._to_tensor(frame))
+
+        for batch_size in batch_sizes:
+            batch = tensor.unsqueeze(0).repeat(batch_size, 1, 1, 1).to(service.device)
+            conv, _ = service.model(batch)
+            bench.run('heatmap', 'forward', resolution, batch_size, lambda: service.model(batch))
+            bench.run('heatmap', 'cam', resolution, batch_size, lambda: service.cams_from_features(conv, 2))
+            frames = [contents] * batch_size
+            bench.run('heatmap', 'process_frames', resolution, batch_size,
+                      lambda: loop.run_until_complete(service.process_frames(frames)))
+
+        cam = service.cams_from_features(conv[:1], 2)[0]
+        blended = service._blend(frame, cam)
+        bench.run('heatmap', 'blend', resolution, 1, lambda: service._blend(frame, cam))
+        bench.run('heatmap', 'encode', resolution, 1, lambda: service._encode(blended))
+
+def bench_websocket(bench: Benchmark, images: Dict[str, bytes]) -> None:
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as client:
+        with client.websocket_connect('/ws/heatmap?mode=binary') as websocket:
+            def round_trip(contents: bytes) -> None:
+                websocket.send_bytes(contents)
+                while True:
+                    message = websocket.receive()
+                    if message.get('bytes') is not None:
+                        return
+
+            for resolution, contents in images.items():
+                bench.run('websocket', 'round_trip', resolution, 1, lambda: round_trip(contents))
+
+async def _cancel_pending() -> None:
+    pending = asyncio.all_tasks() - {asyncio.current_task()}
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results: List[dict], baseline_path: str, threshold: float) -> int:
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    key = lambda r: (r['group'], r['stage'], r['resolution'], r['batch_size'], r['threads'])
+    previous = {key(r): r for r in baseline}
+
+    regressions = 0
+    print(f"\nComparison against {baseline_path} (p50):")
+    for result in results:
+        old = previous.get(key(result))
+        if old is None or old['p50_ms'] <= 0:
+            continue
+        change = (result['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f"  {'/'.join(map(str, key(result)))}: {old['p50_ms']:.2f} -> {result['p50_ms']:.2f} ms "
+              f"({change:+.1f}%){flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--groups', nargs='+', choices=GROUPS, default=list(GROUPS))
+    parser.add_argument('--resolutions', nargs='+', choices=list(RESOLUTIONS), default=list(RESOLUTIONS))
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 4, 8])
+    parser.add_argument('--threads', nargs='+', type=int, default=[torch.get_num_threads()])
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help="Previous results file to compare p50 latencies against")
+    parser.add_argument('--regression-threshold', type=float, default=10.0,
+                        help="Percent p50 slowdown reported as a regression")
+    args = parser.parse_args()
+
+    images = {name: synthetic_jpeg(*RESOLUTIONS[name]) for name in args.resolutions}
+    bench = Benchmark(args.repeats, args.warmup)
+    loop = asyncio.new_event_loop()
+    # Created up front so its initializer does not override the thread counts below.
+    get_inference_executor()
+
+    for threads in args.threads:
+        torch.set_num_threads(threads)
+        bench.threads = threads
+        if 'prediction' in args.groups:
+            bench_prediction(bench, loop, images, args.batch_sizes)
+        if 'heatmap' in args.groups:
+            bench_heatmap(bench, loop, images, args.batch_sizes)
+        if 'websocket' in args.groups:
+            bench_websocket(bench, images)
+
+    # Stop the batcher and pump workers the services started on this loop.
+    loop.run_until_complete(_cancel_pending())
+    loop.close()
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+            'cpu_count': os.cpu_count(),
+            'platform': platform.platform(),
+            'args': vars(args),
+        },
+        'results': bench.results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {len(bench.results)} results to {args.output}")
+
+    if args.compare and compare(bench.results, args.compare, args.regression_threshold):
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
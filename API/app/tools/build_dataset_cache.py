@@ -0,0 +1,130 @@
+"""Converts an image folder once into memory-mapped uint8 shards.
+
+Run from the ``app`` directory::
+
+    python -m tools.build_dataset_cache new-plant-diseases-dataset/valid cache/valid --workers 8
+    python -m tools.build_dataset_cache new-plant-diseases-dataset/valid cache/valid --benchmark
+
+The input is laid out like ``ImageFolder`` (one subdirectory per class).
+Images are decoded by DataLoader workers, resized and centre-cropped to
+``--size`` like the API's ``transform`` (PlantVillage images are already
+256x256 and pass through untouched), and written as ``3 x size x size``
+uint8 rows of ``images-NNNNN.npy`` shards, plus ``labels.npy``, ``paths.txt``
+and ``index.json``. Load the result with ``utils.dataset_cache.MemmapImageDataset``.
+
+``--benchmark`` then times one pass of a DataLoader over the JPEGs and over
+the cache with the same batch size and workers.
+"""
+import argparse
+import os
+import time
+from typing import List, Optional, Tuple
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+from torchvision import transforms
+from config.config import IMAGE_SIZE
+from utils.dataset_cache import DatasetCacheWriter, MemmapImageDataset, find_images
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+def decode(path: str, resize: transforms.Compose) -> np.ndarray:
+    image = resize(Image.open(path).convert('RGB'))
+    return np.ascontiguousarray(np.asarray(image).transpose(2, 0, 1))
+
+class DecodeForCache(Dataset):
+    """Yields ``(index, uint8 CHW array or None, error)`` so bad files do not stop the build."""
+
+    def __init__(self, samples: List[Tuple[str, int]], size: int):
+        self.samples = samples
+        self.resize = transforms.Compose([transforms.Resize(size), transforms.CenterCrop(size)])
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, index):
+        try:
+            return index, decode(self.samples[index][0], self.resize), None
+        except Exception as e:
+            return index, None, f"{type(e).__name__}: {e}"
+
+class ImageFileDataset(DecodeForCache):
+    """Decodes the files on every access, like ``ImageFolder`` with ``ToTensor``; the baseline the cache replaces."""
+
+    def __getitem__(self, index):
+        path, label = self.samples[index]
+        return torch.from_numpy(decode(path, self.resize)).float().div_(255), label
+
+def collate_decoded(items):
+    return items
+
+def build(samples: List[Tuple[str, int]], classes: List[str], output: str, size: int,
+          shard_size: int, workers: int) -> int:
+    writer = DatasetCacheWriter(output, size, len(samples), classes, shard_size)
+    loader = DataLoader(DecodeForCache(samples, size), batch_size=64, num_workers=workers,
+                        collate_fn=collate_decoded)
+    failed = 0
+    start = time.perf_counter()
+    try:
+        for batch in loader:
+            for index, image, error in batch:
+                path, label = samples[index]
+                if image is None:
+                    failed += 1
+                    print(f"\n  skipped {path}: {error}")
+                    continue
+                writer.append(image, label, path)
+            print(f"\r  {writer.written + failed}/{len(samples)} images, "
+                  f"{(writer.written + failed) / (time.perf_counter() - start):.0f} img/s", end='', flush=True)
+    finally:
+        writer.close()
+    print()
+    return failed
+
+def time_epoch(dataset: Dataset, batch_size: int, workers: int) -> float:
+    loader = DataLoader(dataset, batch_size=batch_size, num_workers=workers, shuffle=True)
+    start = time.perf_counter()
+    for images, _ in loader:
+        pass
+    return time.perf_counter() - start
+
+def benchmark(samples: List[Tuple[str, int]], output: str, size: int, batch_size: int, workers: int) -> None:
+    cached = MemmapImageDataset(output)
+    decoded = ImageFileDataset([samples[i] for i in _cached_rows(cached, samples)], size)
+    # The first pass over the shards faults them in from disk; time a warm one.
+    time_epoch(cached, batch_size, workers)
+    jpeg_seconds = time_epoch(decoded, batch_size, workers)
+    cache_seconds = time_epoch(cached, batch_size, workers)
+    print(f"epoch over {len(cached)} images, batch {batch_size}, {workers} workers:")
+    print(f"  decode every pass  {jpeg_seconds:.2f}s ({len(cached) / jpeg_seconds:.0f} img/s)")
+    print(f"  memory-mapped      {cache_seconds:.2f}s ({len(cached) / cache_seconds:.0f} img/s)")
+    print(f"  speedup            {jpeg_seconds / cache_seconds:.1f}x")
+
+def _cached_rows(cached: MemmapImageDataset, samples: List[Tuple[str, int]]) -> List[int]:
+    positions = {path: i for i, (path, _) in enumerate(samples)}
+    return [positions[path] for path in cached.paths()]
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input_dir')
+    parser.add_argument('output_dir')
+    parser.add_argument('--size', type=int, default=IMAGE_SIZE)
+    parser.add_argument('--shard-size', type=int, default=4096, help="Images per shard file")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--benchmark', action='store_true', help="Compare epoch time against decoding the JPEGs")
+    parser.add_argument('--batch-size', type=int, default=64, help="Batch size for --benchmark")
+    args = parser.parse_args(argv)
+
+    samples, classes = find_images(args.input_dir, IMAGE_EXTENSIONS)
+    if not samples:
+        parser.error(f"no images found in {args.input_dir}")
+    print(f"{len(samples)} images in {len(classes)} classes -> {args.output_dir}")
+    failed = build(samples, classes, args.output_dir, args.size, args.shard_size, args.workers)
+    print(f"wrote {len(samples) - failed} images, skipped {failed}")
+
+    if args.benchmark:
+        benchmark(samples, args.output_dir, args.size, args.batch_size, args.workers)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Real-time CAM viewer built on ``HeatmapService``.
+
+Run from the ``app`` directory::
+
+    python -m tools.cam_viewer --source 0
+    python -m tools.cam_viewer --source clip.mp4 --output heatmap.mp4
+    python -m tools.cam_viewer --source leaves/ --headless --lossless --max-frames 500
+
+The source is a camera index, a video file or a directory of images.
+Capture, inference and display run on separate threads joined by latest-wins
+queues (see ``services/frame_pipeline.py``); ``--lossless`` makes the queues
+block instead so every frame is processed. A summary with throughput, drops
+and capture-to-display latency is printed at the end.
+"""
+import argparse
+import json
+from typing import List, Optional
+import torch
+from config.websocket_config import WebSocketConfig
+from services.frame_pipeline import HeatmapPipeline, NullSink, VideoFileSink, WindowSink, open_source
+from services.heatmap_service import HeatmapService
+from services.stream_state import StreamOptions, StreamState
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', default='0', help="Camera index, video file or image directory")
+    parser.add_argument('--label', type=int, default=2, help="Class whose activation map is shown")
+    parser.add_argument('--headless', action='store_true', help="Do not open a window")
+    parser.add_argument('--output', help="Write the heatmap frames to this video file instead of a window")
+    parser.add_argument('--lossless', action='store_true', help="Process every frame instead of the newest")
+    parser.add_argument('--queue-size', type=int, default=1)
+    parser.add_argument('--fps', type=float, help="Pace video files and image directories at this rate")
+    parser.add_argument('--loop', action='store_true', help="Repeat an image directory")
+    parser.add_argument('--max-frames', type=int)
+    parser.add_argument('--threads', type=int, default=None, help="torch intra-op threads for inference")
+    parser.add_argument('--render', choices=['full', 'reduced', 'roi'], default='full')
+    parser.add_argument('--temporal', action='store_true', help="Reuse the map while the scene is unchanged")
+    parser.add_argument('--adaptive', action='store_true', help="Lower the model input size to hold --target-ms")
+    parser.add_argument('--target-ms', type=float, default=WebSocketConfig().TARGET_LATENCY_MS)
+    args = parser.parse_args(argv)
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    try:
+        source = open_source(args.source, args.loop)
+    except ValueError as e:
+        parser.error(str(e))
+
+    service = HeatmapService()
+    service.warmup()
+    options = StreamOptions(render=args.render, temporal=args.temporal, adaptive=args.adaptive,
+                            target_ms=args.target_ms)
+    state = None if options.is_default else StreamState(options, service.config)
+
+    if args.output:
+        sink = VideoFileSink(args.output, args.fps or service.config.FRAME_RATE)
+    elif args.headless:
+        sink = NullSink()
+    else:
+        sink = WindowSink()
+
+    pipeline = HeatmapPipeline(source, service, sink, args.label, state,
+                               drop_frames=not args.lossless, queue_size=args.queue_size, fps=args.fps)
+    stats = pipeline.run(args.max_frames)
+    print(json.dumps(stats, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Compares the fast preprocessing path against the PIL/torchvision one.
+
+Run from the ``app`` directory::
+
+    python -m tools.compare_decoders path/to/leaf/images
+
+Reports decode time per image for both paths, the pixel difference between
+their tensors and ResNet9 top-1 agreement.
+"""
+import argparse
+import os
+import time
+import torch
+from config.config import IN_CHANNELS, NUM_DISEASES
+from models.engines import load_engine, logits_of
+from models.resnet9 import load_plant_disease_model
+from utils.image_utils import decode_image_fast, decode_image_pil
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+def _timed(decoder, contents: bytes):
+    start = time.perf_counter()
+    tensor = decoder(contents)
+    return tensor, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('image_dir')
+    parser.add_argument('--limit', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=16)
+    args = parser.parse_args()
+
+    paths = []
+    for root, _, files in os.walk(args.image_dir):
+        paths.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith(IMAGE_EXTENSIONS))
+    paths = paths[:args.limit]
+    if not paths:
+        parser.error(f"no images found in {args.image_dir}")
+
+    model = load_engine('resnet9', lambda: load_plant_disease_model(IN_CHANNELS, NUM_DISEASES))
+    pil_time = fast_time = 0.0
+    max_diff = mean_diff = 0.0
+    agree = 0
+
+    for start in range(0, len(paths), args.batch_size):
+        pil_batch, fast_batch = [], []
+        for path in paths[start:start + args.batch_size]:
+            with open(path, 'rb') as f:
+                contents = f.read()
+            pil_tensor, elapsed = _timed(decode_image_pil, contents)
+            pil_time += elapsed
+            fast_tensor, elapsed = _timed(decode_image_fast, contents)
+            fast_time += elapsed
+
+            diff = (pil_tensor - fast_tensor).abs()
+            max_diff = max(max_diff, diff.max().item())
+            mean_diff += diff.mean().item()
+            pil_batch.append(pil_tensor)
+            fast_batch.append(fast_tensor)
+
+        pil_preds = logits_of(model(torch.stack(pil_batch))).argmax(1)
+        fast_preds = logits_of(model(torch.stack(fast_batch))).argmax(1)
+        agree += (pil_preds == fast_preds).sum().item()
+
+    count = len(paths)
+    print(f"images:           {count}")
+    print(f"pil decode:       {pil_time / count * 1000:.2f} ms/img")
+    print(f"fast decode:      {fast_time / count * 1000:.2f} ms/img ({pil_time / max(fast_time, 1e-9):.1f}x)")
+    print(f"pixel |diff|:     mean {mean_diff / count:.4f}, max {max_diff:.4f}")
+    print(f"top-1 agreement:  {agree / count:.2%}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""Exports the ResNet9 and CAM weights to the non-eager inference backends.
+
+Run from the ``app`` directory::
+
+    python -m tools.export_models --calibration-dir path/to/leaf/images
+
+Artifacts are written to ``MODEL_ARTIFACTS_DIR`` and a parity report against
+the eager fp32 model is printed for every exported backend.
+"""
+import argparse
+import copy
+import os
+import time
+from typing import Callable, Dict, List
+import torch
+import torch.nn as nn
+from PIL import Image
+from torchvision import transforms
+from config.config import CASCADE_IMAGE_SIZE, IN_CHANNELS, NUM_DISEASES, MODEL_ARTIFACTS_DIR
+from config.websocket_config import WebSocketConfig
+from models.cam_model import load_cam_model
+from models.engines import BACKENDS, EagerEngine, artifact_path, logits_of, open_artifact, select_quantized_engine
+from models.resnet9 import load_plant_disease_model
+from utils.image_utils import transform as resnet9_transform
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+def cam_transform():
+    config = WebSocketConfig()
+    return transforms.Compose([
+        transforms.Resize((config.FRAME_HEIGHT, config.FRAME_WIDTH)),
+        transforms.ToTensor(),
+    ])
+
+MODELS: Dict[str, dict] = {
+    'resnet9': {
+        'factory': lambda: load_plant_disease_model(IN_CHANNELS, NUM_DISEASES, return_features=True),
+        'transform': lambda: resnet9_transform,
+        'input_shape': (3, 256, 256),
+        'output_names': ['res2_features', 'logits'],
+    },
+    'resnet9_fast': {
+        'factory': lambda: load_plant_disease_model(IN_CHANNELS, NUM_DISEASES, global_pool=True),
+        'transform': lambda: transforms.Compose([
+            resnet9_transform, transforms.Resize(CASCADE_IMAGE_SIZE, antialias=True)
+        ]),
+        'input_shape': (3, CASCADE_IMAGE_SIZE, CASCADE_IMAGE_SIZE),
+        'output_names': ['logits'],
+    },
+    'cam': {
+        'factory': lambda: load_cam_model(WebSocketConfig().MODEL_PATH),
+        'transform': cam_transform,
+        'input_shape': (3, WebSocketConfig().FRAME_HEIGHT, WebSocketConfig().FRAME_WIDTH),
+        'output_names': ['conv_features', 'logits'],
+    },
+}
+
+def load_inputs(directory: str, transform: Callable, input_shape: tuple, count: int) -> List[torch.Tensor]:
+    if not directory:
+        print(f"  no image directory given, using {count} random inputs")
+        return [torch.rand(input_shape) for _ in range(count)]
+
+    inputs = []
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                inputs.append(transform(Image.open(os.path.join(root, name)).convert('RGB')))
+                if len(inputs) >= count:
+                    return inputs
+    return inputs
+
+def trace_and_freeze(model: nn.Module, example: torch.Tensor) -> torch.jit.ScriptModule:
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example, check_trace=False)
+    # Freezing inlines the weights and folds Conv+BatchNorm pairs.
+    return torch.jit.freeze(traced.eval())
+
+def quantize_static(model: nn.Module, example: torch.Tensor, calibration: List[torch.Tensor]) -> nn.Module:
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    engine = select_quantized_engine()
+    prepared = prepare_fx(copy.deepcopy(model), get_default_qconfig_mapping(engine), (example,))
+    with torch.no_grad():
+        for image in calibration:
+            prepared(image.unsqueeze(0))
+    return convert_fx(prepared)
+
+def quantize_dynamic(model: nn.Module) -> nn.Module:
+    select_quantized_engine()
+    # Only the Linear layers have dynamic int8 kernels; convolutions stay fp32.
+    return torch.ao.quantization.quantize_dynamic(copy.deepcopy(model), {nn.Linear}, dtype=torch.qint8)
+
+def export(name: str, backend: str, model: nn.Module, example: torch.Tensor,
+           calibration: List[torch.Tensor], output_dir: str) -> str:
+    path = artifact_path(name, backend, output_dir)
+
+    if backend == 'onnx':
+        output_names = MODELS[name]['output_names']
+        torch.onnx.export(
+            model, (example,), path,
+            input_names=['input'],
+            output_names=output_names,
+            dynamic_axes={key: {0: 'batch'} for key in ['input'] + output_names},
+            opset_version=17,
+            dynamo=False
+        )
+        return path
+
+    if backend == 'torchscript':
+        exported = model
+    elif backend == 'int8_static':
+        exported = quantize_static(model, example, calibration)
+    elif backend == 'int8_dynamic':
+        exported = quantize_dynamic(model)
+    else:
+        raise ValueError(f"Cannot export backend '{backend}'")
+    torch.jit.save(trace_and_freeze(exported, example), path)
+    return path
+
+def _time_per_image(engine, batch: torch.Tensor, repeats: int = 3) -> float:
+    engine(batch)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        engine(batch)
+    return (time.perf_counter() - start) / (repeats * len(batch)) * 1000
+
+def parity_check(eager: nn.Module, engine, inputs: List[torch.Tensor], batch_size: int) -> dict:
+    eager_engine = EagerEngine(eager)
+    agree, total, max_diff = 0, 0, 0.0
+    for start in range(0, len(inputs), batch_size):
+        batch = torch.stack(inputs[start:start + batch_size])
+        expected = logits_of(eager_engine(batch))
+        actual = logits_of(engine(batch))
+        agree += (expected.argmax(1) == actual.argmax(1)).sum().item()
+        total += len(batch)
+        max_diff = max(max_diff, (expected - actual).abs().max().item())
+
+    timing_batch = torch.stack(inputs[:batch_size])
+    return {
+        'top1_agreement': agree / total if total else 0.0,
+        'max_abs_logit_diff': max_diff,
+        'eager_ms_per_image': _time_per_image(eager_engine, timing_batch),
+        'backend_ms_per_image': _time_per_image(engine, timing_batch),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--models', nargs='+', choices=list(MODELS), default=list(MODELS))
+    parser.add_argument('--backends', nargs='+', choices=[b for b in BACKENDS if b != 'eager'],
+                        default=['torchscript', 'int8_static', 'onnx'])
+    parser.add_argument('--output-dir', default=MODEL_ARTIFACTS_DIR)
+    parser.add_argument('--calibration-dir', help="Images used to calibrate static int8 quantization")
+    parser.add_argument('--calibration-samples', type=int, default=64)
+    parser.add_argument('--parity-dir', help="Images used for the parity check (defaults to --calibration-dir)")
+    parser.add_argument('--parity-samples', type=int, default=128)
+    parser.add_argument('--batch-size', type=int, default=8)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for name in args.models:
+        spec = MODELS[name]
+        print(f"{name}:")
+        model = spec['factory']()
+        transform = spec['transform']()
+        example = torch.rand((1,) + spec['input_shape'])
+        calibration = load_inputs(args.calibration_dir, transform, spec['input_shape'], args.calibration_samples)
+        parity_inputs = load_inputs(args.parity_dir or args.calibration_dir, transform,
+                                    spec['input_shape'], args.parity_samples)
+
+        for backend in args.backends:
+            path = export(name, backend, model, example, calibration, args.output_dir)
+            report = parity_check(model, open_artifact(path, backend), parity_inputs, args.batch_size)
+            print(f"  {backend:<13} {path}")
+            print(f"    top-1 agreement {report['top1_agreement']:.2%}, "
+                  f"max |logit diff| {report['max_abs_logit_diff']:.4f}, "
+                  f"{report['eager_ms_per_image']:.1f} ms/img eager -> "
+                  f"{report['backend_ms_per_image']:.1f} ms/img {backend}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Stand-in for the NodeMCU pump controller, for local testing.
+
+Mirrors ``bot_schema/base_nodeMCU/sketch_nov18b``: ``POST /pump/action`` with
+``{"mix1": ms, "mix2": ms}`` runs both pumps for 1000-10000 ms and answers 409
+while they are still running. Run from the ``app`` directory::
+
+    python -m tools.fake_nodemcu --port 8081
+    NODEMCU_URL=http://127.0.0.1:8081/pump/action python main.py
+"""
+import argparse
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI()
+state = {"active_until": 0.0, "commands": []}
+
+@app.post("/pump/action")
+async def pump_action(request: Request):
+    if time.monotonic() < state["active_until"]:
+        return JSONResponse(content={"error": "Pump already active"}, status_code=409)
+
+    try:
+        body = await request.json()
+        duration_pump1 = int(body["mix1"])
+        duration_pump2 = int(body["mix2"])
+    except (ValueError, KeyError, TypeError):
+        return JSONResponse(content={"error": "Invalid request"}, status_code=400)
+
+    if not (1000 <= duration_pump1 <= 10000 and 1000 <= duration_pump2 <= 10000):
+        return JSONResponse(content={"error": "Invalid request"}, status_code=400)
+
+    state["active_until"] = time.monotonic() + max(duration_pump1, duration_pump2) / 1000
+    state["commands"].append(body)
+    return {"status": "success", "pump1_duration": duration_pump1, "pump2_duration": duration_pump2}
+
+@app.get("/pump/commands")
+async def pump_commands():
+    return {"commands": state["commands"]}
+
+if __name__ == "__main__":
+    import uvicorn
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,143 @@
+import bisect
+import json
+import os
+from typing import Callable, Iterable, List, Optional, Tuple
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+INDEX_FILE = 'index.json'
+LABELS_FILE = 'labels.npy'
+PATHS_FILE = 'paths.txt'
+
+def shard_name(number: int) -> str:
+    return f'images-{number:05d}.npy'
+
+class DatasetCacheWriter:
+    """Writes decoded ``3 x size x size`` uint8 images into ``.npy`` shards.
+
+    Shards are created with ``open_memmap`` for up to ``count`` images and
+    filled in place, so memory use does not grow with the dataset. Images
+    that fail to decode are simply not appended; ``index.json`` records how
+    many rows of each shard are valid. ``close`` writes the labels, the
+    source paths and ``index.json``, which ``MemmapImageDataset`` reads.
+    """
+
+    def __init__(self, directory: str, size: int, count: int, classes: List[str], shard_size: int = 4096):
+        self.directory = directory
+        self.size = size
+        self.count = count
+        self.classes = classes
+        self.shard_size = max(1, shard_size)
+        self.written = 0
+        self.labels = np.full(count, -1, dtype=np.int64)
+        self.paths: List[str] = []
+        self._shards: List[np.memmap] = []
+        os.makedirs(directory, exist_ok=True)
+        for number, start in enumerate(range(0, count, self.shard_size)):
+            shape = (min(self.shard_size, count - start), 3, size, size)
+            self._shards.append(np.lib.format.open_memmap(
+                os.path.join(directory, shard_name(number)), mode='w+', dtype=np.uint8, shape=shape
+            ))
+
+    def append(self, image: np.ndarray, label: int, path: str) -> None:
+        shard, offset = divmod(self.written, self.shard_size)
+        self._shards[shard][offset] = image
+        self.labels[self.written] = label
+        self.paths.append(path)
+        self.written += 1
+
+    def close(self) -> None:
+        for shard in self._shards:
+            shard.flush()
+        self._shards = []
+        np.save(os.path.join(self.directory, LABELS_FILE), self.labels[:self.written])
+        with open(os.path.join(self.directory, PATHS_FILE), 'w') as f:
+            f.writelines(path + '\n' for path in self.paths)
+
+        counts = [min(self.shard_size, self.written - start) for start in range(0, self.written, self.shard_size)]
+        index = {
+            'size': self.size,
+            'count': self.written,
+            'classes': self.classes,
+            'shards': [{'file': shard_name(n), 'count': c} for n, c in enumerate(counts)],
+        }
+        with open(os.path.join(self.directory, INDEX_FILE), 'w') as f:
+            json.dump(index, f, indent=2)
+
+class MemmapImageDataset(Dataset):
+    """Images pre-decoded by ``python -m tools.build_dataset_cache``.
+
+    Items are ``(image, label)`` like ``ImageFolder``. Each image is a view
+    into a memory-mapped shard; by default it is converted to float in
+    ``[0, 1]`` (what ``transforms.ToTensor()`` gives) and passed through
+    ``transform``. With ``to_float=False`` the uint8 view is returned as is,
+    so the conversion can happen on the batch instead.
+
+    Shards are opened lazily in each process, so DataLoader workers map the
+    same files (shared through the page cache) instead of pickling arrays.
+    They are mapped copy-on-write, which lets tensors wrap them without a
+    copy; writes through a tensor never reach the files.
+    """
+
+    def __init__(self, directory: str, transform: Optional[Callable] = None, to_float: bool = True):
+        self.directory = directory
+        self.transform = transform
+        self.to_float = to_float
+        with open(os.path.join(directory, INDEX_FILE)) as f:
+            index = json.load(f)
+        self.size = index['size']
+        self.classes: List[str] = index['classes']
+        self.class_to_idx = {name: i for i, name in enumerate(self.classes)}
+        self.shard_files = [shard['file'] for shard in index['shards']]
+        self.offsets = np.cumsum([0] + [shard['count'] for shard in index['shards']]).tolist()
+        self.targets: List[int] = np.load(os.path.join(directory, LABELS_FILE)).tolist()
+        self._shards: Optional[List[np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return self.offsets[-1]
+
+    def __getitem__(self, index: int) -> Tuple[torch.Tensor, int]:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        shard = bisect.bisect_right(self.offsets, index) - 1
+        image = torch.from_numpy(self._open()[shard][index - self.offsets[shard]])
+        if self.to_float:
+            image = image.float().div_(255)
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, self.targets[index]
+
+    def paths(self) -> List[str]:
+        with open(os.path.join(self.directory, PATHS_FILE)) as f:
+            return f.read().splitlines()
+
+    def _open(self) -> List[np.ndarray]:
+        if self._shards is None:
+            self._shards = [
+                np.load(os.path.join(self.directory, name), mmap_mode='c') for name in self.shard_files
+            ]
+        return self._shards
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_shards'] = None
+        return state
+
+def find_images(root: str, extensions: Iterable[str]) -> Tuple[List[Tuple[str, int]], List[str]]:
+    """``(path, label)`` pairs and class names, laid out like ``ImageFolder``.
+
+    Each subdirectory of ``root`` is a class, in sorted order. Like
+    ``ImageFolder``, images directly in ``root`` are ignored.
+    """
+    extensions = tuple(extensions)
+    classes = sorted(entry.name for entry in os.scandir(root) if entry.is_dir())
+    samples = []
+    for label, name in enumerate(classes):
+        for directory, _, files in sorted(os.walk(os.path.join(root, name))):
+            samples.extend(
+                (os.path.join(directory, file), label) for file in sorted(files) if file.lower().endswith(extensions)
+            )
+    return samples, classes
@@ -0,0 +1,68 @@
+import asyncio
+import functools
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+import torch
+from config.config import EXECUTOR_TYPE, EXECUTOR_WORKERS, INFERENCE_WORKERS, TORCH_NUM_THREADS
+
+_inference_executor: Optional[Executor] = None
+_preprocessing_executor: Optional[Executor] = None
+
+def _init_worker() -> None:
+    torch.set_num_threads(TORCH_NUM_THREADS)
+
+def get_inference_executor() -> Executor:
+    """Thread pool for work that needs the in-process models.
+
+    torch releases the GIL inside its kernels, so a small pool of threads sharing
+    one bounded intra-op thread pool keeps the event loop free without
+    oversubscribing the CPU.
+    """
+    global _inference_executor
+    if _inference_executor is None:
+        _init_worker()
+        _inference_executor = ThreadPoolExecutor(
+            max_workers=INFERENCE_WORKERS,
+            thread_name_prefix='inference'
+        )
+    return _inference_executor
+
+def get_preprocessing_executor() -> Executor:
+    """Executor for model-free CPU work (image decoding, resizing).
+
+    With ``EXECUTOR_TYPE=process`` the callables must be picklable module-level
+    functions.
+    """
+    global _preprocessing_executor
+    if _preprocessing_executor is None:
+        if EXECUTOR_TYPE == 'process':
+            _preprocessing_executor = ProcessPoolExecutor(
+                max_workers=EXECUTOR_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker
+            )
+        elif EXECUTOR_TYPE == 'thread':
+            _preprocessing_executor = ThreadPoolExecutor(
+                max_workers=EXECUTOR_WORKERS,
+                thread_name_prefix='preprocessing'
+            )
+        else:
+            raise ValueError(f"Unknown EXECUTOR_TYPE: {EXECUTOR_TYPE}")
+    return _preprocessing_executor
+
+async def run_inference(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_inference_executor(), functools.partial(fn, *args, **kwargs))
+
+async def run_preprocessing(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_preprocessing_executor(), functools.partial(fn, *args, **kwargs))
+
+def shutdown_executors() -> None:
+    global _inference_executor, _preprocessing_executor
+    for executor in (_inference_executor, _preprocessing_executor):
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+    _inference_executor = None
+    _preprocessing_executor = None
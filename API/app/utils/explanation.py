@@ -0,0 +1,36 @@
+import base64
+from typing import Optional
+import cv2
+import numpy as np
+import torch
+from schemas.prediction import Explanation
+
+EXPLAIN_FORMATS = ('array', 'png')
+
+def class_activation_maps(features: torch.Tensor, weight: torch.Tensor, classes: torch.Tensor) -> np.ndarray:
+    """Class activation maps of each image for the given class, scaled to [0, 1].
+
+    ``features`` are the maps the classifier pools (``B x C x H x W``) and
+    ``weight`` is its ``num_classes x C`` linear layer; each map is the
+    weighted sum of the channels for that image's class, with negative
+    evidence clipped.
+    """
+    with torch.no_grad():
+        cams = torch.einsum('bc,bchw->bhw', weight[classes].to(features.dtype), features)
+    cams = cams.clamp_(min=0).cpu().numpy()
+    cams /= np.maximum(cams.max(axis=(-2, -1), keepdims=True), 1e-12)
+    return cams
+
+def encode_explanation(cam: Optional[np.ndarray], fmt: str) -> Explanation:
+    if cam is None:
+        raise ValueError("The loaded model does not return feature maps; re-run `python -m tools.export_models`")
+    if fmt not in EXPLAIN_FORMATS:
+        raise ValueError(f"Unknown explanation format '{fmt}', expected one of {EXPLAIN_FORMATS}")
+
+    values = np.round(cam * 255).astype(np.uint8)
+    if fmt == 'png':
+        _, buffer = cv2.imencode('.png', values)
+        data = base64.b64encode(buffer.tobytes()).decode('ascii')
+    else:
+        data = values.tolist()
+    return Explanation(format=fmt, height=values.shape[0], width=values.shape[1], data=data)
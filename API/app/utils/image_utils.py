@@ -1,14 +1,102 @@
+import hashlib
 import io
+import time
+from typing import Tuple
+import cv2
+import numpy as np
 from PIL import Image
+import torch
 import torchvision.transforms as transforms
+from config.config import FAST_DECODE, IMAGE_SIZE, UPLOAD_CHUNK_SIZE
+from utils.executor import run_preprocessing
+from utils.metrics import STAGE_SECONDS
 
 transform = transforms.Compose([
-    transforms.Resize(256),
-    transforms.CenterCrop(256),
+    transforms.Resize(IMAGE_SIZE),
+    transforms.CenterCrop(IMAGE_SIZE),
     transforms.ToTensor(),
 ])
 
+class UploadTooLargeError(ValueError):
+    pass
+
+class RequestTooLargeError(UploadTooLargeError):
+    pass
+
+def _open_pil(contents: bytes) -> Image.Image:
+    return Image.open(io.BytesIO(contents)).convert('RGB')
+
+def decode_image_pil(contents: bytes) -> torch.Tensor:
+    return transform(_open_pil(contents))
+
+def decode_image_fast(contents: bytes, size: int = IMAGE_SIZE) -> torch.Tensor:
+    """Equivalent of ``transform`` that avoids decoding pixels it would discard.
+
+    JPEGs are decoded with DCT scaling (``Image.draft``) straight to the smallest
+    power-of-two reduction that is still at least ``size`` pixels on each side.
+    The centre square is then resized to ``size`` in one OpenCV call and
+    converted to float into a preallocated tensor.
+    """
+    return _square_tensor(_open_draft(contents, size), size)
+
+def _open_draft(contents: bytes, size: int) -> np.ndarray:
+    image = Image.open(io.BytesIO(contents))
+    image.draft('RGB', (size, size))
+    return np.asarray(image.convert('RGB'))
+
+def _square_tensor(array: np.ndarray, size: int) -> torch.Tensor:
+    h, w = array.shape[:2]
+    side = min(h, w)
+    top = int(round((h - side) / 2.0))
+    left = int(round((w - side) / 2.0))
+    square = array[top:top + side, left:left + side]
+    interpolation = cv2.INTER_AREA if side > size else cv2.INTER_LINEAR
+    resized = cv2.resize(square, (size, size), interpolation=interpolation)
+
+    output = torch.empty((3, size, size), dtype=torch.float32)
+    output.copy_(torch.from_numpy(resized).permute(2, 0, 1))
+    return output.div_(255)
+
+def decode_image_timed(contents: bytes) -> Tuple[torch.Tensor, float, float]:
+    """Decodes with the configured decoder (``FAST_DECODE``) and returns the decode and preprocess times.
+
+    The times are returned rather than recorded so they reach the metrics of
+    the serving process even when this runs in a worker process.
+    """
+    start = time.perf_counter()
+    if FAST_DECODE:
+        array = _open_draft(contents, IMAGE_SIZE)
+        decoded = time.perf_counter()
+        tensor = _square_tensor(array, IMAGE_SIZE)
+    else:
+        image = _open_pil(contents)
+        decoded = time.perf_counter()
+        tensor = transform(image)
+    return tensor, decoded - start, time.perf_counter() - decoded
+
+async def read_upload(file, max_bytes: int) -> Tuple[bytearray, str]:
+    """Reads an upload in chunks into a single buffer, enforcing ``max_bytes``.
+
+    Returns the buffer and the SHA-256 of its contents, hashed as it streams in.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLargeError(f"{file.filename} is larger than {max_bytes} bytes")
+
+    contents = bytearray()
+    digest = hashlib.sha256()
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        if len(contents) + len(chunk) > max_bytes:
+            raise UploadTooLargeError(f"{file.filename} is larger than {max_bytes} bytes")
+        contents += chunk
+        digest.update(chunk)
+    return contents, digest.hexdigest()
+
+async def transform_bytes(contents: bytes) -> torch.Tensor:
+    tensor, decode_seconds, preprocess_seconds = await run_preprocessing(decode_image_timed, contents)
+    STAGE_SECONDS.observe(decode_seconds, pipeline='prediction', stage='decode')
+    STAGE_SECONDS.observe(preprocess_seconds, pipeline='prediction', stage='preprocess')
+    return tensor
+
 async def transform_image(file):
     contents = await file.read()
-    image = Image.open(io.BytesIO(contents)).convert('RGB')
-    return transform(image)
+    return await transform_bytes(contents)
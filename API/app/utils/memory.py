@@ -0,0 +1,54 @@
+import os
+from typing import Optional
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes, or None where unsupported."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+def reset_peak_rss() -> bool:
+    """Resets the kernel's RSS high-water mark (Linux only)."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def peak_rss() -> Optional[int]:
+    """RSS high-water mark in bytes since start or the last ``reset_peak_rss``."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+class MemoryProbe:
+    """Tracks the peak RSS growth over a request by sampling at checkpoints.
+
+    RSS is process-wide, so with concurrent requests the figure is an upper
+    bound for any single one of them.
+    """
+
+    def __init__(self):
+        self.baseline = current_rss()
+        self.peak = self.baseline
+
+    def sample(self) -> None:
+        rss = current_rss()
+        if rss is not None and self.peak is not None:
+            self.peak = max(self.peak, rss)
+
+    @property
+    def peak_delta(self) -> int:
+        if self.baseline is None or self.peak is None:
+            return 0
+        return self.peak - self.baseline
@@ -0,0 +1,203 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple, Union
+
+LabelValues = Tuple[str, ...]
+Sample = Tuple[Dict[str, str], float]
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    pairs = (f'{name}="{_escape(str(value))}"' for name, value in labels.items())
+    return '{' + ','.join(pairs) + '}'
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: LabelValues) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name, self._labels(key), value
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts, then sum and count.
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, list(state)) for key, state in self._values.items())
+        for key, state in values:
+            labels = self._labels(key)
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, 'le': _format_value(bound)}, cumulative
+            yield f"{self.name}_sum", labels, state[-2]
+            yield f"{self.name}_count", labels, state[-1]
+
+class CallbackMetric(_Metric):
+    """Reads its samples from a function at scrape time.
+
+    Used to export counters and gauges that components already keep in their
+    own ``stats()`` (queue depths, cache hits) without double bookkeeping.
+    The callback returns a single number or a list of ``(labels, value)``.
+    """
+
+    def __init__(self, name: str, documentation: str, kind: str,
+                 callback: Callable[[], Union[float, List[Sample]]]):
+        super().__init__(name, documentation)
+        self.kind = kind
+        self.callback = callback
+
+    def samples(self):
+        value = self.callback()
+        if isinstance(value, (int, float)):
+            yield self.name, {}, value
+            return
+        for labels, sample in value:
+            yield self.name, labels, sample
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_callback(self, name: str, documentation: str,
+                       callback: Callable[[], Union[float, List[Sample]]]) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, 'gauge', callback))
+
+    def counter_callback(self, name: str, documentation: str,
+                         callback: Callable[[], Union[float, List[Sample]]]) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, 'counter', callback))
+
+    def render(self) -> str:
+        """Text exposition format understood by Prometheus scrapers."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'plant_stage_duration_seconds',
+    'Time spent in each stage of the prediction and heatmap pipelines.',
+    ['pipeline', 'stage']
+)
+BATCH_SIZE = REGISTRY.histogram(
+    'plant_inference_batch_size',
+    'Number of images per forward pass.',
+    ['pipeline'],
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+REQUESTS = REGISTRY.counter(
+    'plant_http_requests_total',
+    'HTTP requests by route and status code.',
+    ['method', 'endpoint', 'status']
+)
+ERRORS = REGISTRY.counter(
+    'plant_errors_total',
+    'Failures that did not fail the whole request (bad files, bad frames, pump sends).',
+    ['source']
+)
+WEBSOCKET_FRAMES = REGISTRY.counter(
+    'plant_websocket_frames_total',
+    'Heatmap stream frames by outcome.',
+    ['outcome']
+)
+CAM_REUSED = REGISTRY.counter(
+    'plant_cam_reused_total',
+    'Heatmap frames rendered with the previous activation map because the scene had not changed.'
+)
+
+def stage_timer(pipeline: str, stage: str):
+    return STAGE_SECONDS.time(pipeline=pipeline, stage=stage)